@@ -0,0 +1,108 @@
+import os
+import sys
+
+from utils import find_album
+
+
+def _intern_album(artist_name, album_name, dirname):
+    # Every track's tags bring their own copies of the names; interned,
+    # an artist's name is one string however many albums it has.
+    return sys.intern(artist_name), sys.intern(album_name), sys.intern(dirname)
+
+
+class album_catalog(object):
+    # The albums of the library as (artist, album, dir) tuples, the one
+    # sorted copy the album grid shows. Albums are registered by add() and
+    # looked up by dir from then on; the grid places them in album_sort_key
+    # order with insert() when it lays them out, so that it can announce
+    # each change. Placed albums are kept in columns: the albums, their
+    # keys (bisected, see iter_album_insertions and find_album) and their
+    # album_index ids.
+
+    def __init__(self):
+        self._albums = []
+        self._keys = []
+        self._ids = []
+        self._dir_albums = {} # dir -> album, or a list when it has several
+
+    def __len__(self):
+        return len(self._albums)
+
+    def __getitem__(self, position):
+        return self._albums[position]
+
+    def __iter__(self):
+        return iter(self._albums)
+
+    def __contains__(self, album):
+        return album in self.get_dir_albums(album[2])
+
+    @property
+    def keys(self):
+        return self._keys
+
+    @property
+    def ids(self):
+        return self._ids
+
+    def get_dir_albums(self, dirname):
+        dir_albums = self._dir_albums.get(dirname)
+        if dir_albums is None:
+            return []
+        if isinstance(dir_albums, list):
+            return list(dir_albums)
+        return [dir_albums]
+
+    def get_tree_albums(self, root):
+        # the albums in root and below it
+        prefix = os.path.join(root, '')
+        return [album for dirname in self._dir_albums
+                if dirname == root or dirname.startswith(prefix)
+                for album in self.get_dir_albums(dirname)]
+
+    def add(self, artist_album_dict):
+        # Registers the albums of an artist_album_dict (as
+        # get_artist_album_dict returns) and returns the ones that were not
+        # in the catalog yet, to be placed.
+        new_albums = []
+        for artist_name, album_set in artist_album_dict.items():
+            for album_name, dirname in album_set:
+                album = _intern_album(artist_name, album_name, dirname)
+                dir_albums = self._dir_albums.get(album[2])
+                if dir_albums is None:
+                    self._dir_albums[album[2]] = album
+                elif isinstance(dir_albums, list):
+                    if album in dir_albums:
+                        continue
+                    dir_albums.append(album)
+                elif dir_albums != album:
+                    self._dir_albums[album[2]] = [dir_albums, album]
+                else:
+                    continue
+                new_albums.append(album)
+        return new_albums
+
+    def discard(self, albums):
+        # Unregisters albums; the placed ones are taken out with pop().
+        for album in albums:
+            dir_albums = self._dir_albums.get(album[2])
+            if isinstance(dir_albums, list) and album in dir_albums:
+                dir_albums.remove(album)
+                if len(dir_albums) == 1:
+                    self._dir_albums[album[2]] = dir_albums[0]
+            elif dir_albums == album:
+                del self._dir_albums[album[2]]
+
+    def find(self, album):
+        # position of a placed album, or None
+        return find_album(self._keys, album, self._albums.__getitem__)
+
+    def insert(self, position, albums, keys, ids):
+        self._albums[position:position] = albums
+        self._keys[position:position] = keys
+        self._ids[position:position] = ids
+
+    def pop(self, position):
+        del self._keys[position]
+        del self._ids[position]
+        return self._albums.pop(position)
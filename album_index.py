@@ -0,0 +1,180 @@
+import re
+import unicodedata
+from bisect import bisect_left
+from collections import defaultdict
+
+
+MAX_PREFIX_LENGTH = 2 # query tokens up to this long are looked up directly
+_TOKEN_PATTERN = re.compile(r'\w+')
+# scripts written without spaces; every suffix of such a token is indexed
+# so that a query can match in the middle of a title.
+_UNSPACED_PATTERN = re.compile('[\u3040-\u30ff\u3400-\u9fff\uf900-\ufaff\uff66-\uff9f\uac00-\ud7af]')
+
+
+def normalize_tokens(text):
+    # case and accent insensitive word tokens
+    if not text.isascii():
+        text = unicodedata.normalize('NFKD', text)
+        text = ''.join(c for c in text if not unicodedata.combining(c))
+    return _TOKEN_PATTERN.findall(text.casefold())
+
+
+def _index_tokens(text):
+    tokens = set()
+    for token in normalize_tokens(text):
+        if not token.isascii() and _UNSPACED_PATTERN.search(token):
+            tokens.update(token[i:] for i in range(len(token)))
+        else:
+            tokens.add(token)
+    return tokens
+
+
+class album_index(object):
+    # In-memory search over (artist, album, dir) tuples. Artist and album
+    # names are split into normalized tokens. A query matches the albums
+    # having, for each query token, a token starting with it: short query
+    # tokens are looked up in a table of token prefixes, longer ones by
+    # bisecting the sorted distinct tokens. Albums are also tracked by
+    # whether they have a cover, for the missing cover facet.
+
+    def __init__(self):
+        self._ids = {}
+        self._albums = []
+        self._tokens = []
+        self._postings = {} # token -> album ids
+        self._prefixes = defaultdict(set) # prefix up to MAX_PREFIX_LENGTH -> album ids
+        self._sorted_tokens = [] # may still hold tokens without albums
+        self._new_tokens = []
+        self._dir_ids = defaultdict(list) # mostly one album per dir
+        self._all_ids = set()
+        self._missing_cover_ids = set()
+        self._cover_dirs = set()
+        self._name_tokens = {} # names repeat (artists), so they are tokenized once
+
+    def __len__(self):
+        return len(self._all_ids)
+
+    def get_id(self, album):
+        return self._ids.get(album)
+
+    def get_album(self, album_id):
+        return self._albums[album_id]
+
+    def _get_name_tokens(self, name):
+        tokens = self._name_tokens.get(name)
+        if tokens is None:
+            tokens = self._name_tokens[name] = tuple(_index_tokens(name))
+        return tokens
+
+    def add(self, albums):
+        for album in albums:
+            if album in self._ids:
+                continue
+            album_id = len(self._albums)
+            artist_name, album_name, dirname = album
+            tokens = set(self._get_name_tokens(artist_name))
+            tokens.update(self._get_name_tokens(album_name))
+            self._ids[album] = album_id
+            self._albums.append(album)
+            self._tokens.append(tuple(tokens))
+            for token in tokens:
+                postings = self._postings.get(token)
+                if postings is None:
+                    postings = self._postings[token] = set()
+                    self._new_tokens.append(token)
+                postings.add(album_id)
+                for i in range(1, min(len(token), MAX_PREFIX_LENGTH) + 1):
+                    self._prefixes[token[:i]].add(album_id)
+            self._dir_ids[dirname].append(album_id)
+            self._all_ids.add(album_id)
+            if dirname not in self._cover_dirs:
+                self._missing_cover_ids.add(album_id)
+
+    def remove(self, albums):
+        # ids are not reused; the slots of removed albums stay empty
+        for album in albums:
+            album_id = self._ids.pop(album, None)
+            if album_id is None:
+                continue
+            for token in self._tokens[album_id]:
+                self._postings[token].discard(album_id)
+                for i in range(1, min(len(token), MAX_PREFIX_LENGTH) + 1):
+                    self._prefixes[token[:i]].discard(album_id)
+            self._dir_ids[album[2]].remove(album_id)
+            self._all_ids.discard(album_id)
+            self._missing_cover_ids.discard(album_id)
+            self._albums[album_id] = None
+            self._tokens[album_id] = ()
+
+    def set_has_cover(self, dirname, has_cover):
+        if has_cover:
+            self._cover_dirs.add(dirname)
+            self._missing_cover_ids.difference_update(self._dir_ids.get(dirname, ()))
+        else:
+            self._cover_dirs.discard(dirname)
+            self._missing_cover_ids.update(self._dir_ids.get(dirname, ()))
+
+    def _merge_new_tokens(self):
+        # Tokens added since the last search are merged in at once; tokens
+        # left without albums are dropped at the same time.
+        if len(self._new_tokens) == 0:
+            return
+        for token in [t for t, postings in self._postings.items() if len(postings) == 0]:
+            del self._postings[token]
+        self._sorted_tokens.extend(self._new_tokens)
+        self._sorted_tokens = sorted(t for t in set(self._sorted_tokens) if t in self._postings)
+        self._new_tokens = []
+
+    def _get_token_ids(self, query_token):
+        if len(query_token) <= MAX_PREFIX_LENGTH:
+            return self._prefixes.get(query_token, set())
+        ids = set()
+        i = bisect_left(self._sorted_tokens, query_token)
+        while i < len(self._sorted_tokens) and self._sorted_tokens[i].startswith(query_token):
+            ids.update(self._postings.get(self._sorted_tokens[i], ()))
+            i += 1
+        return ids
+
+    def search(self, query, missing_cover_only=False):
+        # Returns the matching albums as an album_matches, or None when
+        # nothing is filtered.
+        query_tokens = normalize_tokens(query)
+        if len(query_tokens) == 0 and not missing_cover_only:
+            return None
+
+        self._merge_new_tokens()
+        id_sets = [self._get_token_ids(token) for token in query_tokens]
+        if missing_cover_only:
+            id_sets.append(self._missing_cover_ids)
+        id_sets.sort(key=len)
+        if len(id_sets) == 1:
+            # one or two characters, or the facet alone: the set kept for
+            # them is the result, not a copy of its thousands of ids
+            return album_matches(self._ids, self._albums, id_sets[0])
+        return album_matches(self._ids, self._albums, id_sets[0].intersection(*id_sets[1:]))
+
+
+class album_matches(object):
+    # A search result: album ids looked up through the index, so that
+    # results with most of the library in them are not copied. Checking
+    # ids (see album_index.get_id) is much cheaper than checking albums.
+    # The ids may be the index's own set, which follows later changes;
+    # search again after adding or removing albums.
+
+    def __init__(self, ids, albums, match_ids):
+        self._ids = ids
+        self._albums = albums
+        self._match_ids = match_ids
+
+    def __len__(self):
+        return len(self._match_ids)
+
+    def __iter__(self):
+        return (self._albums[i] for i in self._match_ids)
+
+    def __contains__(self, album):
+        return self._ids.get(album) in self._match_ids
+
+    @property
+    def ids(self):
+        return self._match_ids
@@ -0,0 +1,180 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Fetches covers for every album without a cover.jpg.
+#
+#   python batch_fetch.py [--jobs N] [--host-rate R] <music dirs...>
+#
+# Progress is appended to a JSON lines file, so an interrupted run can be
+# restarted and skips albums it has already handled.
+import os
+import sys
+import json
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt5.QtCore import QCoreApplication
+
+from utils import *
+from http_session import get_http_session
+from instrumentation import get_metrics, set_metrics_path
+
+
+N_JOBS = 8 # albums searched concurrently
+N_CANDIDATES = 10 # search results ranked per album
+HOST_RATE = 2.0 # requests per second per host
+PROGRESS_PATH = os.path.join(CACHE_DIR, 'batch_fetch_progress.jsonl')
+
+SAVED = 'saved'
+NOT_FOUND = 'not_found'
+FAILED = 'failed'
+
+
+def get_missing_cover_albums(albums, art_paths=None):
+    # albums (an album_catalog or (artist, album, dir) tuples) with neither
+    # a cover.jpg nor embedded art (art_paths, as filled by
+    # get_artist_album_dict)
+    art_paths = art_paths if art_paths is not None else {}
+    return [(artist_name, album_name, dirname) for artist_name, album_name, dirname in albums
+            if dirname not in art_paths and not os.path.exists(os.path.join(dirname, 'cover.jpg'))]
+
+
+def write_cover(candidate, cover_file_path):
+    # JPEG results are written as downloaded, anything else is re-encoded.
+    tmp_path = '{}.{}.tmp'.format(cover_file_path, os.getpid())
+    if candidate.format == 'JPG':
+        with open(tmp_path, 'wb') as f:
+            f.write(candidate.data)
+    elif not decode_cover_candidate(candidate).save(tmp_path, 'JPG'):
+        raise OSError('could not encode {}'.format(candidate.url))
+    os.replace(tmp_path, cover_file_path)
+
+
+class batch_fetcher(object):
+    def __init__(self, n_jobs=N_JOBS, n_candidates=N_CANDIDATES, host_rate=HOST_RATE,
+                 progress_path=PROGRESS_PATH, retry_failed=False):
+        self._n_jobs = n_jobs
+        self._n_candidates = n_candidates
+        self._host_rate = host_rate
+        self._progress_path = progress_path
+        self._retry_failed = retry_failed
+        self._progress_lock = threading.Lock()
+
+    def load_progress(self):
+        progress = {}
+        if not os.path.exists(self._progress_path):
+            return progress
+        with open(self._progress_path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError: # a line cut off by an interrupted run
+                    continue
+                progress[record['dir']] = record['status']
+        return progress
+
+    def pending_albums(self, albums):
+        progress = self.load_progress()
+        done_statuses = (SAVED,) if self._retry_failed else (SAVED, NOT_FOUND, FAILED)
+        return [album for album in albums if progress.get(album[2]) not in done_statuses]
+
+    def run(self, albums, on_result=None, cancel_event=None):
+        # on_result(artist, album, dirname, status) is called from the job
+        # threads as albums finish. Returns {status: count}.
+        get_http_session().set_host_rate(self._host_rate)
+        counts = {SAVED: 0, NOT_FOUND: 0, FAILED: 0}
+        counts_lock = threading.Lock()
+
+        def fetch(album):
+            if is_canceled(cancel_event):
+                return
+            status = self._fetch_album(album, cancel_event)
+            if status is None: # canceled
+                return
+            try:
+                self._record(album[2], status)
+            except OSError as e: # the album still counts, it is only searched again
+                print('progress write error: {}: {}'.format(album[2], e))
+            with counts_lock:
+                counts[status] += 1
+            if on_result is not None:
+                on_result(*album, status)
+
+        try:
+            with ThreadPoolExecutor(max_workers=self._n_jobs) as executor:
+                list(executor.map(fetch, albums))
+        finally:
+            get_http_session().set_host_rate(None)
+        return counts
+
+    def _fetch_album(self, album, cancel_event):
+        artist_name, album_name, dirname = album
+        try:
+            # A run over thousands of albums would fill the search cache
+            # with images nobody looks at again; only pages are cached.
+            candidates = download_cover_images(artist_name, album_name, 1, self._n_candidates,
+                                               cancel_event, cache_images=False)
+            if is_canceled(cancel_event):
+                return None
+            if len(candidates) == 0:
+                return NOT_FOUND
+            best = max(candidates, key=cover_candidate_score)
+            write_cover(best, os.path.join(dirname, 'cover.jpg'))
+            return SAVED
+        except Exception as e:
+            print('cover fetch error: {}: {}'.format(dirname, e))
+            return FAILED
+
+    def _record(self, dirname, status):
+        with self._progress_lock:
+            progress_dir = os.path.dirname(self._progress_path)
+            if progress_dir != '':
+                os.makedirs(progress_dir, exist_ok=True)
+            with open(self._progress_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({'dir': dirname, 'status': status}) + '\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fetch covers for albums without cover.jpg.')
+    parser.add_argument('paths', nargs='+')
+    parser.add_argument('--jobs', type=int, default=N_JOBS)
+    parser.add_argument('--candidates', type=int, default=N_CANDIDATES)
+    parser.add_argument('--host-rate', type=float, default=HOST_RATE)
+    parser.add_argument('--progress', default=PROGRESS_PATH)
+    parser.add_argument('--retry-failed', action='store_true',
+                        help='search again for albums that previously failed or found nothing')
+    parser.add_argument('--metrics', help='append timing events to this JSON lines file')
+    parser.add_argument('--summary', action='store_true', help='print a timing summary at the end')
+    args = parser.parse_args()
+
+    if args.metrics is not None:
+        set_metrics_path(args.metrics)
+
+    app = QCoreApplication(sys.argv) # image format plugins
+
+    art_paths = {}
+    artist_album_dict = get_artist_album_dict(get_mp3_file_paths(args.paths), art_paths=art_paths)
+    albums = get_missing_cover_albums(get_sorted_albums(artist_album_dict), art_paths)
+    fetcher = batch_fetcher(args.jobs, args.candidates, args.host_rate, args.progress,
+                            args.retry_failed)
+    albums = fetcher.pending_albums(albums)
+    print('{} albums to fetch'.format(len(albums)))
+
+    n_done = [0]
+    report_lock = threading.Lock()
+    def report(artist_name, album_name, dirname, status):
+        with report_lock:
+            n_done[0] += 1
+            print('[{}/{}] {}: {} - {}'.format(n_done[0], len(albums), status, artist_name,
+                                              album_name))
+
+    counts = fetcher.run(albums, report)
+    print('saved: {}, not found: {}, failed: {}'.format(counts[SAVED], counts[NOT_FOUND],
+                                                        counts[FAILED]))
+    if args.summary:
+        print(get_metrics().summary())
+    get_metrics().close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Compares the album bookkeeping of main_widget plus album_list_model
+# before and with album_catalog. Before: a defaultdict(set) of (album, dir)
+# per artist, a set of albums per dir, and the model's sorted columns of
+# albums, keys and ids. With it: the catalog alone, which the model shows
+# directly. Both place albums in sorted order with iter_album_insertions
+# at every layout update. Reports the memory each holds for a synthetic
+# library (tracemalloc, input chunks excluded), the time to load it in scan
+# sized chunks and the time to drop --drop more albums onto it.
+#
+#   python benchmarks/bench_catalog.py --sizes 10000 50000
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import merge_artist_album_dict, iter_album_insertions
+from album_catalog import album_catalog
+
+
+def iter_chunks(n_albums, n_artists, chunk_size, first=0):
+    # artist_album_dicts as tag reading returns them: every chunk has its
+    # own copies of the names, like the tags of the files it was read from
+    for start in range(first, first + n_albums, chunk_size):
+        artist_album_dict = defaultdict(set)
+        for i in range(start, min(start + chunk_size, first + n_albums)):
+            artist_name = 'Artist Name {}'.format(i % n_artists)
+            album_name = 'Album Title Number {}'.format(i)
+            dirname = '/music/{}/{}'.format(artist_name, album_name)
+            artist_album_dict[artist_name].add((album_name, dirname))
+        yield artist_album_dict
+
+
+class dict_albums(object):
+    # the previous main_widget and album_list_model bookkeeping
+
+    def __init__(self):
+        self._artist_album_dict = defaultdict(set)
+        self._dir_albums = defaultdict(set)
+        self._all_albums = []
+        self._all_keys = []
+        self._all_ids = []
+        self._n_ids = 0
+
+    def __len__(self):
+        return len(self._all_albums)
+
+    def add(self, artist_album_dict):
+        new_albums = merge_artist_album_dict(self._artist_album_dict, artist_album_dict)
+        for album in new_albums:
+            self._dir_albums[album[2]].add(album)
+        for position, albums, keys in iter_album_insertions(self._all_keys, new_albums):
+            self._all_albums[position:position] = albums
+            self._all_keys[position:position] = keys
+            self._all_ids[position:position] = range(self._n_ids, self._n_ids + len(albums))
+            self._n_ids += len(albums)
+
+
+class catalog_albums(object):
+
+    def __init__(self):
+        self._catalog = album_catalog()
+        self._n_ids = 0
+
+    def __len__(self):
+        return len(self._catalog)
+
+    def add(self, artist_album_dict):
+        new_albums = self._catalog.add(artist_album_dict)
+        for position, albums, keys in iter_album_insertions(self._catalog.keys, new_albums):
+            self._catalog.insert(position, albums, keys,
+                                 range(self._n_ids, self._n_ids + len(albums)))
+            self._n_ids += len(albums)
+
+
+def measure(make, n_albums, n_artists, chunk_size, n_drop):
+    tracemalloc.start()
+    albums = make()
+    t0 = time.perf_counter()
+    for chunk in iter_chunks(n_albums, n_artists, chunk_size):
+        albums.add(chunk)
+        del chunk
+    load_elapsed = time.perf_counter() - t0
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    drop = next(iter_chunks(n_drop, n_artists, n_drop, first=n_albums))
+    t0 = time.perf_counter()
+    albums.add(drop)
+    drop_elapsed = time.perf_counter() - t0
+    assert len(albums) == n_albums + n_drop
+    return size, load_elapsed, drop_elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 50000])
+    parser.add_argument('--albums-per-artist', type=int, default=8)
+    parser.add_argument('--chunk', type=int, default=50, help='albums per scan chunk')
+    parser.add_argument('--drop', type=int, default=10)
+    args = parser.parse_args()
+
+    print('{:>8} {:<10} {:>10} {:>10} {:>10}'.format(
+        'albums', 'structure', 'size[MB]', 'load[s]', 'drop[ms]'))
+    for n in args.sizes:
+        n_artists = max(1, n // args.albums_per_artist)
+        for name, make in (('dict', dict_albums), ('catalog', catalog_albums)):
+            size, load_elapsed, drop_elapsed = measure(make, n, n_artists, args.chunk, args.drop)
+            print('{:>8} {:<10} {:>10.1f} {:>10.3f} {:>10.2f}'.format(
+                n, name, size / 2 ** 20, load_elapsed, drop_elapsed * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Measures the album filter for synthetic libraries: building album_index,
+# its memory (tracemalloc), the latency of queries of different lengths, and
+# per keystroke while typing them, the search plus the album_list_model
+# update, including the album_grid_view handling it.
+#
+#   QT_QPA_PLATFORM=offscreen python benchmarks/bench_filter.py --sizes 50000
+import os
+import sys
+import time
+import random
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyQt5.QtWidgets import QApplication
+
+import ui
+from album_index import album_index
+from album_catalog import album_catalog
+from instrumentation import percentile
+
+COMMON_WORDS = ['the', 'love', 'night', 'blue', 'live', 'greatest', 'hits', 'dream', 'summer',
+                'black', 'white', 'sound', 'music', 'city', 'road', 'fire', 'heart', 'moon',
+                'beyoncé', 'mötley', 'crüe', 'sigur', 'rós', 'orchestra', 'symphony',
+                '夜空', 'ノスタルジア', 'さくら', '東京', 'ベスト', 'アルバム', '青い', '星']
+SYLLABLES = ['ka', 'ro', 'mi', 'tel', 'an', 'dor', 'su', 'vi', 'lo', 'ne', 'ar', 'gen', 'ta',
+             'bri', 'ol', 'us', 'ze', 'pha', 'qui', 'st']
+
+
+def make_words(n_words, rng):
+    words = list(COMMON_WORDS)
+    while len(words) < n_words:
+        words.append(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return words
+
+
+def make_name(words, n_words, rng):
+    # word frequencies roughly follow Zipf's law, as in real titles
+    return ' '.join(words[min(len(words) - 1, int(5 * rng.paretovariate(1.0)) - 5)]
+                    for _ in range(n_words))
+
+
+def make_albums(n_albums, n_artists, seed=0):
+    rng = random.Random(seed)
+    words = make_words(max(1000, n_albums // 2), rng)
+    rng.shuffle(words)
+    artists = [make_name(words, rng.randint(1, 3), rng) for _ in range(n_artists)]
+    return [(rng.choice(artists), make_name(words, rng.randint(1, 4), rng),
+             '/nonexistent/{}'.format(i)) for i in range(n_albums)]
+
+
+def make_queries(albums, n_queries, seed=0):
+    # prefixes of words from actual album and artist names, 1 to 8 chars,
+    # plus some two word queries and the missing cover facet alone
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(n_queries):
+        artist_name, album_name, _ = rng.choice(albums)
+        words = (artist_name + ' ' + album_name).split()
+        query = rng.choice(words)[:rng.randint(1, 8)]
+        if rng.random() < 0.3:
+            query += ' ' + rng.choice(words)[:rng.randint(1, 4)]
+        queries.append((query, rng.random() < 0.2))
+    return queries
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 50000])
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--typed', type=int, default=100, help='queries typed into the view')
+    args = parser.parse_args()
+
+    app = QApplication(sys.argv)
+
+    print('{:>8} {:>10} {:>10} {:>10} {:>10} {:>10} {:>12} {:>12} {:>12}'.format(
+        'albums', 'build[s]', 'index[MB]', 'p50[ms]', 'p95[ms]', 'max[ms]',
+        'matches p50', 'key p50[ms]', 'key p95[ms]'))
+    for n in args.sizes:
+        albums = make_albums(n, max(1, n // 10))
+
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        index = album_index()
+        index.add(albums)
+        build_elapsed = time.perf_counter() - t0
+        index_bytes, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        for _, _, dirname in albums[::2]:
+            index.set_has_cover(dirname, True)
+
+        samples = []
+        n_matches = []
+        queries = make_queries(albums, args.queries)
+        for query, missing_cover_only in queries:
+            t0 = time.perf_counter()
+            matches = index.search(query, missing_cover_only)
+            samples.append(time.perf_counter() - t0)
+            n_matches.append(len(matches) if matches is not None else n)
+        samples.sort()
+        n_matches.sort()
+
+        # typed one character at a time, like main_widget._filter_albums
+        # with the view showing the model, until its events are handled
+        model = ui.album_list_model(album_catalog(), index)
+        model.insert_albums(albums)
+        view = ui.album_grid_view()
+        view.setModel(model)
+        view.resize(ui.WINDOW_WIDTH, ui.WINDOW_HEIGHT)
+        view.show()
+        key_samples = []
+        for query, _ in queries[:args.typed]:
+            model.set_shown_albums(None)
+            app.processEvents()
+            for i in range(1, len(query) + 1):
+                t0 = time.perf_counter()
+                model.set_shown_albums(index.search(query[:i]), narrowed=i > 1)
+                app.processEvents()
+                key_samples.append(time.perf_counter() - t0)
+        view.close()
+        key_samples.sort()
+
+        print('{:>8} {:>10.3f} {:>10.1f} {:>10.3f} {:>10.3f} {:>10.3f} {:>12} {:>12.1f} '
+              '{:>12.1f}'.format(
+            n, build_elapsed, index_bytes / 2 ** 20, percentile(samples, 0.5) * 1000,
+            percentile(samples, 0.95) * 1000, samples[-1] * 1000, percentile(n_matches, 0.5),
+            percentile(key_samples, 0.5) * 1000, percentile(key_samples, 0.95) * 1000))
+
+
+if __name__ == '__main__':
+    main()
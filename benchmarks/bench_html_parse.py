@@ -0,0 +1,96 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Compares the old BeautifulSoup/lxml link extraction with
+# utils.extract_image_urls on saved search result pages (or a synthetic
+# page when none are given): time per page and peak allocation.
+#
+#   python benchmarks/bench_html_parse.py [page.html ...]
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import extract_image_urls, MAX_URLS_PER_PAGE
+
+
+def legacy_extract_image_urls(data):
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(data, 'lxml')
+    a_tags = soup.find_all('a')
+    IMAGE_EXTENTIONS = ['.jpg', '.jpeg', '.png']
+    image_urls = []
+    for a_tag in a_tags:
+        link_url = a_tag.get('href')
+        if link_url is None:
+            continue
+        for ext in IMAGE_EXTENTIONS:
+            if ext in link_url:
+                image_urls.append(link_url)
+    return image_urls
+
+
+def make_synthetic_page(n_results=60):
+    # roughly shaped like an image search result page: scripts, styles,
+    # navigation links and one thumbnail block per result.
+    parts = ['<!DOCTYPE html><html><head><title>search</title>']
+    parts.append('<style>' + '.c{margin:0;padding:0}' * 400 + '</style>')
+    parts.append('<script>' + 'var x = "<a href=\\"#\\">";' * 300 + '</script>')
+    parts.append('</head><body><div id="nav">')
+    for i in range(80):
+        parts.append('<a href="/search?p=q&amp;b={}" class="nav">{}</a>'.format(i * 20 + 1, i))
+    parts.append('</div><div id="results">')
+    for i in range(n_results):
+        parts.append(
+            '<div class="result" data-idx="{0}"><a data-href="/r/{0}" '
+            'href="http://img{1}.example.com/covers/{0}.jpg?size=large&amp;v=2" target="_blank">'
+            '<img src="http://thumb.example.com/t/{0}.png" alt="result {0}"></a>'
+            '<p><a href="http://site{1}.example.com/page/{0}.html">source</a></p></div>'.format(i, i % 7))
+    parts.append('</div><a>no href</a></body></html>')
+    return ''.join(parts)
+
+
+def measure(func, data, repeat):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        result = func(data)
+    elapsed = (time.perf_counter() - t0) / repeat
+
+    tracemalloc.start()
+    func(data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('pages', nargs='*')
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    if len(args.pages) != 0:
+        pages = [(p, open(p, encoding='utf-8', errors='replace').read()) for p in args.pages]
+    else:
+        pages = [('<synthetic>', make_synthetic_page())]
+
+    print('{:<24} {:>8} {:>6} {:>12} {:>12} {:>12} {:>12}'.format(
+        'page', 'KB', 'urls', 'bs4[ms]', 'regex[ms]', 'bs4 peak[KB]', 'regex peak[KB]'))
+    for name, data in pages:
+        legacy_urls, legacy_elapsed, legacy_peak = measure(legacy_extract_image_urls, data, args.repeat)
+        urls, elapsed, peak = measure(
+            lambda d: extract_image_urls(d, MAX_URLS_PER_PAGE), data, args.repeat)
+        if len(legacy_urls) > MAX_URLS_PER_PAGE:
+            legacy_urls = legacy_urls[:MAX_URLS_PER_PAGE]
+        if [u for u in legacy_urls] != urls:
+            print('warning: url lists differ for {} ({} vs {})'.format(name, len(legacy_urls), len(urls)))
+        print('{:<24} {:>8.0f} {:>6} {:>12.2f} {:>12.2f} {:>12.0f} {:>12.0f}'.format(
+            os.path.basename(name)[:24], len(data) / 1024, len(urls),
+            legacy_elapsed * 1000, elapsed * 1000, legacy_peak / 1024, peak / 1024))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Measures how long main_widget takes to build the album grid for synthetic
+# libraries, and how long dropping --drop more albums onto it takes after
+# that. "legacy wiring" reproduces the old all-pairs
+# begin_search/end_search connections on top of the widget grid; it is
+# quadratic, so it is only run up to --legacy-limit albums and estimated
+# beyond that.
+#
+#   QT_QPA_PLATFORM=offscreen python benchmarks/bench_layout.py
+import os
+import sys
+import time
+import argparse
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyQt5.QtWidgets import QApplication
+
+import ui
+
+
+def make_artist_album_dict(n_albums, n_artists=500, first=0):
+    artist_album_dict = defaultdict(set)
+    for i in range(first, first + n_albums):
+        artist_name = 'artist {}'.format(i % n_artists)
+        album_name = 'album {}'.format(i)
+        artist_album_dict[artist_name].add((album_name, '/nonexistent/{}'.format(i)))
+    return artist_album_dict
+
+
+def add(w, artist_album_dict):
+    t0 = time.perf_counter()
+    w.add_albums(artist_album_dict)
+    QApplication.processEvents()
+    return time.perf_counter() - t0
+
+
+def build(artist_album_dict, virtualized):
+    w = ui.main_widget(virtualized=virtualized)
+    elapsed = add(w, artist_album_dict)
+    return w, elapsed
+
+
+def legacy_wiring(album_widgets):
+    t0 = time.perf_counter()
+    for i in range(len(album_widgets)):
+        for j in range(len(album_widgets)):
+            if i == j:
+                continue
+            album_widgets[i].cover.begin_search.connect(album_widgets[j].cover.disable)
+            album_widgets[i].cover.end_search.connect(album_widgets[j].cover.enable)
+    return time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 5000, 10000])
+    parser.add_argument('--legacy-limit', type=int, default=1000)
+    parser.add_argument('--drop', type=int, default=10)
+    args = parser.parse_args()
+
+    app = QApplication(sys.argv)
+
+    print('{:>8} {:>14} {:>18} {:>14} {:>16} {:>14}'.format(
+        'albums', 'widget grid[s]', 'legacy wiring[s]', 'view grid[s]',
+        'widget drop[s]', 'view drop[s]'))
+    legacy_rate = None
+    for n in args.sizes:
+        artist_album_dict = make_artist_album_dict(n)
+        dropped_dict = make_artist_album_dict(args.drop, first=n)
+
+        w, widget_elapsed = build(artist_album_dict, virtualized=False)
+        if n <= args.legacy_limit:
+            album_widgets = w.findChildren(ui.album_widget)
+            wiring_elapsed = legacy_wiring(album_widgets)
+            legacy_rate = wiring_elapsed / (n * n)
+            wiring = '{:.3f}'.format(wiring_elapsed)
+        elif legacy_rate is not None:
+            wiring = '~{:.1f} (est.)'.format(legacy_rate * n * n)
+        else:
+            wiring = '-'
+        widget_drop_elapsed = add(w, dropped_dict)
+        w.deleteLater()
+        QApplication.processEvents()
+
+        w, view_elapsed = build(artist_album_dict, virtualized=True)
+        view_drop_elapsed = add(w, dropped_dict)
+        w.deleteLater()
+        QApplication.processEvents()
+
+        print('{:>8} {:>14.3f} {:>18} {:>14.3f} {:>16.3f} {:>14.4f}'.format(
+            n, widget_elapsed, wiring, view_elapsed, widget_drop_elapsed, view_drop_elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Offline end-to-end benchmark: builds a synthetic library (make_library.py)
+# and searches against the local stand-in server (stand_in_server.py), then
+# reports throughput, p50/p95 latency and peak Python memory (tracemalloc)
+# for each stage:
+#
+#   scan     get_mp3_file_paths                     latency per directory
+#   tags     get_artist_album_dict, in scan chunks   latency per chunk
+#   layout   main_widget grid build                  one sample per run
+#   search   download_cover_images per album         latency per album
+#
+# Tag reading in the process pool is not seen by tracemalloc; the max RSS of
+# this process is printed at the end.
+#
+#   QT_QPA_PLATFORM=offscreen python benchmarks/bench_pipeline.py --artists 200
+import os
+import sys
+import time
+import shutil
+import resource
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from PyQt5.QtWidgets import QApplication
+
+import ui
+import utils
+from utils import *
+from instrumentation import set_metrics_path, percentile
+from make_library import make_library
+from stand_in_server import stand_in_server, make_images
+
+
+def run_stage(name, unit, func, timer_name=None):
+    # func() returns (n_items, [sample durations] or None); samples default
+    # to the instrumentation timer timer_name.
+    metrics = set_metrics_path(None)
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    n_items, samples = func()
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    if samples is None:
+        timer = metrics.snapshot()['timers'].get(timer_name)
+        p50, p95 = (timer['p50'], timer['p95']) if timer is not None else (0.0, 0.0)
+    else:
+        samples = sorted(samples)
+        p50, p95 = percentile(samples, 0.5), percentile(samples, 0.95)
+    print('{:<8} {:>8} {:<8} {:>10.3f} {:>12.1f} {:>10.1f} {:>10.1f} {:>10.1f}'.format(
+        name, n_items, unit, elapsed, n_items / elapsed if elapsed > 0 else 0,
+        p50 * 1000, p95 * 1000, peak / 2 ** 20))
+    return metrics
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--artists', type=int, default=100)
+    parser.add_argument('--albums', type=int, default=5, help='albums per artist')
+    parser.add_argument('--tracks', type=int, default=10, help='tracks per album')
+    parser.add_argument('--library', help='use (and keep) this library instead of a temporary one')
+    parser.add_argument('--searches', type=int, default=20, help='albums searched')
+    parser.add_argument('--candidates', type=int, default=5, help='images per search')
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--bandwidth', type=float, help='bytes per second per response')
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--recording', help='stand-in server recording to serve')
+    parser.add_argument('--widget-grid', action='store_true',
+                        help='build the widget grid instead of the list view')
+    args = parser.parse_args()
+
+    app = QApplication(sys.argv)
+    work_dir = tempfile.mkdtemp(prefix='album-cover-bench-')
+    # a fresh search cache, so every search goes to the server
+    utils.SEARCH_CACHE_PATH = os.path.join(work_dir, 'search_cache.sqlite')
+
+    library = args.library
+    if library is None or not os.path.isdir(library):
+        library = library or os.path.join(work_dir, 'library')
+        t0 = time.perf_counter()
+        n_files = make_library(library, args.artists, args.albums, args.tracks,
+                               cover_data=make_images(1)[0])
+        print('generated {} files in {:.1f}s'.format(n_files, time.perf_counter() - t0))
+
+    server = stand_in_server(images=make_images(32), latency=args.latency,
+                             bandwidth=args.bandwidth, failure_rate=args.failure_rate,
+                             recording_dir=args.recording).start()
+    utils.SEARCH_URL = server.search_url
+
+    print('{:<8} {:>8} {:<8} {:>10} {:>12} {:>10} {:>10} {:>10}'.format(
+        'stage', 'items', 'unit', 'total[s]', 'items/s', 'p50[ms]', 'p95[ms]', 'peak[MB]'))
+    try:
+        mp3_file_paths = []
+
+        def scan():
+            mp3_file_paths.extend(get_mp3_file_paths([library]))
+            return len(mp3_file_paths), None
+        run_stage('scan', 'files', scan, 'scan.dir')
+
+        artist_album_dict = defaultdict(set)
+
+        def read_tags():
+            for chunk in iter_chunks(mp3_file_paths, ui.SCAN_CHUNK_SIZE):
+                merge_artist_album_dict(artist_album_dict, get_artist_album_dict(chunk))
+            return len(mp3_file_paths), None
+        run_stage('tags', 'files', read_tags, 'tags.read_batch')
+
+        def build_layout():
+            w = ui.main_widget(virtualized=not args.widget_grid, watch=False)
+            t0 = time.perf_counter()
+            w.add_albums(artist_album_dict)
+            QApplication.processEvents()
+            elapsed = time.perf_counter() - t0
+            w.deleteLater()
+            QApplication.processEvents()
+            return get_n_albums(artist_album_dict), [elapsed]
+        run_stage('layout', 'albums', build_layout)
+
+        albums = get_sorted_albums(artist_album_dict)[:args.searches]
+
+        def search():
+            samples = []
+            n_images = 0
+            for artist_name, album_name, _ in albums:
+                t0 = time.perf_counter()
+                n_images += len(download_cover_images(artist_name, album_name, 1,
+                                                      args.candidates))
+                samples.append(time.perf_counter() - t0)
+            return len(albums), samples
+        metrics = run_stage('search', 'albums', search)
+
+        timers = metrics.snapshot()['timers']
+        counters = metrics.snapshot()['counters']
+        for name in ('search.page_fetch', 'image.download', 'image.decode'):
+            if name in timers:
+                print('  {:<20} n={:<6} p50 {:>8.1f} ms  p95 {:>8.1f} ms'.format(
+                    name, timers[name]['count'], timers[name]['p50'] * 1000,
+                    timers[name]['p95'] * 1000))
+        print('  {:<20} {:.2f} MB'.format('image bytes', counters.get('image.bytes', 0) / 2 ** 20))
+    finally:
+        server.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    # ru_maxrss is in KB on Linux and bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print('max RSS: {:.1f} MB'.format(max_rss / (2 ** 20 if sys.platform == 'darwin' else 2 ** 10)))
+
+
+if __name__ == '__main__':
+    main()
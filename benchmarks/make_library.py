@@ -0,0 +1,78 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Writes a synthetic mp3 library: <root>/<artist>/<album>/<track>.mp3 with
+# ID3v2.3 (or v2.4) artist/album/title tags in front of a few silent MPEG
+# frames. Some albums get a cover.jpg and some files are left untagged, so
+# every path of the scanner and the tag reader is exercised.
+#
+#   python benchmarks/make_library.py /tmp/library --artists 100 --albums 5 --tracks 10
+import os
+import random
+import struct
+import argparse
+
+
+# MPEG-1 layer III, 128 kbit/s, 44.1 kHz frame of silence
+_MPEG_FRAME = b'\xff\xfb\x90\x00' + b'\x00' * 413
+
+
+def _syncsafe(n):
+    return bytes([(n >> 21) & 0x7F, (n >> 14) & 0x7F, (n >> 7) & 0x7F, n & 0x7F])
+
+
+def id3v2_tag(frames, version=3):
+    # frames: {frame id: text}; text is UTF-16 in v2.3 and UTF-8 in v2.4
+    body = b''
+    for frame_id, text in frames.items():
+        if version == 4:
+            data = b'\x03' + text.encode('utf-8')
+            size = _syncsafe(len(data))
+        else:
+            data = b'\x01' + text.encode('utf-16')
+            size = struct.pack('>I', len(data))
+        body += frame_id.encode('ascii') + size + b'\x00\x00' + data
+    return b'ID3' + bytes([version, 0, 0]) + _syncsafe(len(body)) + body
+
+
+def make_library(root, n_artists, n_albums, n_tracks, n_frames=8, cover_ratio=0.5,
+                 untagged_ratio=0.02, v24_ratio=0.3, cover_data=None, seed=0):
+    # Returns the number of mp3 files written.
+    rng = random.Random(seed)
+    audio = _MPEG_FRAME * n_frames
+    n_files = 0
+    for a in range(n_artists):
+        artist_name = 'Artist {:04d}'.format(a)
+        for b in range(n_albums):
+            album_name = 'Album {:04d}-{:02d}'.format(a, b)
+            album_dir = os.path.join(root, artist_name, album_name)
+            os.makedirs(album_dir, exist_ok=True)
+            if cover_data is not None and rng.random() < cover_ratio:
+                with open(os.path.join(album_dir, 'cover.jpg'), 'wb') as f:
+                    f.write(cover_data)
+            version = 4 if rng.random() < v24_ratio else 3
+            for t in range(n_tracks):
+                tag = b''
+                if rng.random() >= untagged_ratio:
+                    tag = id3v2_tag({'TPE1': artist_name, 'TALB': album_name,
+                                     'TIT2': 'Track {:02d}'.format(t)}, version)
+                with open(os.path.join(album_dir, '{:02d}.mp3'.format(t)), 'wb') as f:
+                    f.write(tag + audio)
+                n_files += 1
+    return n_files
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('root')
+    parser.add_argument('--artists', type=int, default=100)
+    parser.add_argument('--albums', type=int, default=5, help='albums per artist')
+    parser.add_argument('--tracks', type=int, default=10, help='tracks per album')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    n_files = make_library(args.root, args.artists, args.albums, args.tracks, seed=args.seed)
+    print('{} files in {} albums'.format(n_files, args.artists * args.albums))
+
+
+if __name__ == '__main__':
+    main()
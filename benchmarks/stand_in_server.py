@@ -0,0 +1,239 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Local stand-in for the image search and the image hosts, so searches can
+# be benchmarked without the network. /search?p=...&b=... returns a result
+# page linking images at /img/...; each query gets its own image URLs, so
+# nothing is shared between albums through the search cache.
+#
+# Images are synthetic unless a recording is given (see record()): then
+# recorded pages are served in turn with their image links pointing here,
+# and recorded images are served where available.
+#
+#   python benchmarks/stand_in_server.py --port 8765 --latency 0.05
+#   ALBUM_COVER_SEARCH_URL=http://127.0.0.1:8765/search python ui.py
+import os
+import re
+import sys
+import html
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyQt5.QtGui import QImage, QColor, QPainter
+from PyQt5.QtCore import QBuffer, QByteArray, QIODevice
+
+
+RESULTS_PER_PAGE = 20
+N_RESULTS = 60 # per query, over all pages
+# image links in recorded pages
+_HREF_PATTERN = re.compile(r'''href\s*=\s*(["'])(https?://[^"']+\.(?:jpe?g|png)[^"']*)\1''',
+                           re.IGNORECASE)
+
+
+def make_images(n_images, seed=0):
+    # JPEGs of a few sizes and aspect ratios with random blocks, so they
+    # are neither trivially small nor perceptual duplicates of each other.
+    rng = random.Random(seed)
+    images = []
+    for i in range(n_images):
+        width = rng.choice([300, 500, 600, 800, 1000])
+        height = int(width * rng.choice([1.0, 1.0, 0.75, 1.33]))
+        image = QImage(width, height, QImage.Format_RGB32)
+        image.fill(QColor(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+        painter = QPainter(image)
+        for _ in range(12):
+            painter.fillRect(rng.randrange(width), rng.randrange(height),
+                             rng.randrange(width // 2), rng.randrange(height // 2),
+                             QColor(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+        painter.end()
+        data = QByteArray()
+        buf = QBuffer(data)
+        buf.open(QIODevice.WriteOnly)
+        image.save(buf, 'JPG', 85)
+        images.append(bytes(data))
+    return images
+
+
+def url_key(url):
+    return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+
+class stand_in_server(object):
+    # latency: seconds added before every response; bandwidth: bytes per
+    # second for response bodies (None is unlimited); failure_rate: share
+    # of image requests answered with failure_status.
+
+    def __init__(self, port=0, images=None, latency=0.0, bandwidth=None, failure_rate=0.0,
+                 failure_status=500, recording_dir=None, seed=0):
+        self._images = images if images is not None else make_images(32, seed)
+        self._latency = latency
+        self._bandwidth = bandwidth
+        self._failure_rate = failure_rate
+        self._failure_status = failure_status
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+
+        self._pages = []
+        self._recorded_images = {}
+        if recording_dir is not None:
+            self._load_recording(recording_dir)
+
+        server = self
+        class handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                server._handle(self)
+
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', port), handler)
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def port(self):
+        return self._httpd.server_address[1]
+
+    @property
+    def search_url(self):
+        return 'http://127.0.0.1:{}/search'.format(self.port)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def _load_recording(self, recording_dir):
+        pages_dir = os.path.join(recording_dir, 'pages')
+        for name in sorted(os.listdir(pages_dir)):
+            with open(os.path.join(pages_dir, name), encoding='utf-8', errors='replace') as f:
+                self._pages.append(f.read())
+        images_dir = os.path.join(recording_dir, 'images')
+        if os.path.isdir(images_dir):
+            for name in os.listdir(images_dir):
+                with open(os.path.join(images_dir, name), 'rb') as f:
+                    self._recorded_images[name] = f.read()
+
+    def _handle(self, request):
+        time.sleep(self._latency)
+        url = urlsplit(request.path)
+        if url.path == '/search':
+            params = parse_qs(url.query)
+            body = self._search_page(params.get('p', [''])[0], int(params.get('b', ['1'])[0]))
+            self._send(request, 200, 'text/html; charset=utf-8', body.encode('utf-8'))
+        elif url.path.startswith('/img/'):
+            with self._random_lock:
+                failed = self._random.random() < self._failure_rate
+            if failed:
+                self._send(request, self._failure_status, 'text/plain', b'failure')
+                return
+            key, _ = os.path.splitext(url.path[len('/img/'):])
+            data = self._recorded_images.get(key)
+            if data is None:
+                data = self._images[int(key[:8], 16) % len(self._images)]
+            self._send(request, 200, 'image/jpeg', data)
+        else:
+            self._send(request, 404, 'text/plain', b'not found')
+
+    def _search_page(self, query, start_index):
+        base = 'http://127.0.0.1:{}/img/'.format(self.port)
+        if len(self._pages) != 0:
+            page = self._pages[(start_index - 1) // RESULTS_PER_PAGE % len(self._pages)]
+            return _HREF_PATTERN.sub(
+                lambda m: 'href="{}{}.jpg"'.format(base, url_key(html.unescape(m.group(2)))),
+                page)
+
+        links = ''.join(
+            '<a href="{}{}.jpg">result</a>\n'.format(base, url_key('{}/{}'.format(query, i)))
+            for i in range(start_index - 1, min(start_index - 1 + RESULTS_PER_PAGE, N_RESULTS)))
+        return '<html><body>{}<a href="/search?b={}">next</a></body></html>'.format(
+            links, start_index + RESULTS_PER_PAGE)
+
+    def _send(self, request, status, content_type, body):
+        request.send_response(status)
+        request.send_header('Content-Type', content_type)
+        request.send_header('Content-Length', str(len(body)))
+        request.end_headers()
+        if self._bandwidth is None:
+            request.wfile.write(body)
+            return
+        chunk_size = max(1, int(self._bandwidth // 20)) # 50ms worth per write
+        for i in range(0, len(body), chunk_size):
+            request.wfile.write(body[i:(i + chunk_size)])
+            time.sleep(chunk_size / self._bandwidth)
+
+
+def record(queries, recording_dir):
+    # Saves the live result pages for queries and the images they link, in
+    # the layout stand_in_server(recording_dir=...) serves.
+    from utils import SEARCH_URL, MAX_URLS_PER_PAGE, extract_image_urls, fetch_image_bytes
+    from http_session import get_http_session
+
+    os.makedirs(os.path.join(recording_dir, 'pages'), exist_ok=True)
+    os.makedirs(os.path.join(recording_dir, 'images'), exist_ok=True)
+    for i, query in enumerate(queries):
+        page = get_http_session().get_text(SEARCH_URL, params={'p': query, 'b': 1,
+                                                                'dim': 'medium'})
+        with open(os.path.join(recording_dir, 'pages', '{:04d}.html'.format(i)), 'w',
+                  encoding='utf-8') as f:
+            f.write(page)
+        for url in extract_image_urls(page, MAX_URLS_PER_PAGE):
+            try:
+                data = fetch_image_bytes(url)
+            except Exception as e:
+                print('record error: {}: {}'.format(url, e))
+                continue
+            if data is not None:
+                with open(os.path.join(recording_dir, 'images', url_key(url)), 'wb') as f:
+                    f.write(data)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--bandwidth', type=float, help='bytes per second')
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--recording', help='serve pages and images saved by --record')
+    parser.add_argument('--record', nargs='+', metavar='QUERY',
+                        help='save live search results for QUERY into --recording and exit')
+    args = parser.parse_args()
+
+    from PyQt5.QtGui import QGuiApplication
+    app = QGuiApplication(sys.argv) # image format plugins
+
+    if args.record is not None:
+        if args.recording is None:
+            parser.error('--record needs --recording')
+        record(args.record, args.recording)
+        return
+
+    server = stand_in_server(args.port, latency=args.latency, bandwidth=args.bandwidth,
+                             failure_rate=args.failure_rate, recording_dir=args.recording)
+    print('serving {}'.format(server.search_url))
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+import os
+import itertools
+
+from PyQt5.QtGui import QImage, QImageReader, QPixmap, QPixmapCache
+from PyQt5.QtCore import Qt, QObject, QRunnable, QThread, QThreadPool, QSize, pyqtSignal, pyqtSlot
+
+from thumbnail_cache import thumbnail_cache
+from utils import read_embedded_art
+
+
+LOW_PRIORITY = 0
+PIXMAP_CACHE_LIMIT = 64 * 1024 # KB
+
+
+def read_scaled_image(file_path, size):
+    # Decodes straight to (about) the requested size; JPEG decoding can
+    # skip most of the work this way instead of decoding full resolution.
+    reader = QImageReader(file_path)
+    original_size = reader.size()
+    if original_size.isValid():
+        reader.setScaledSize(original_size.scaled(size, Qt.KeepAspectRatio))
+    return reader.read()
+
+
+def read_scaled_embedded_art(mp3_file_path, size):
+    data = read_embedded_art(mp3_file_path)
+    if data is None:
+        return QImage()
+    image = QImage.fromData(data)
+    if image.isNull():
+        return image
+    return image.scaled(image.size().scaled(size, Qt.KeepAspectRatio), Qt.IgnoreAspectRatio,
+                        Qt.SmoothTransformation)
+
+
+class _cover_load_task(QRunnable):
+    def __init__(self, loader, file_path, size, cache):
+        super(_cover_load_task, self).__init__()
+
+        self.setAutoDelete(False)
+        self._loader = loader
+        self._file_path = file_path
+        self._size = size
+        self._cache = cache
+
+    def run(self):
+        # emitted from the pool thread, delivered on the GUI thread
+        self._loader.loaded.emit(self._file_path, self._load())
+
+    def _load(self):
+        source_path = self._file_path
+        read_image = read_scaled_image
+        try:
+            stat = os.stat(source_path)
+        except OSError:
+            # no cover file; use the art embedded in one of the album's mp3s
+            source_path = self._loader.embedded_art_path(self._file_path)
+            read_image = read_scaled_embedded_art
+            if source_path is None:
+                return QImage()
+            try:
+                stat = os.stat(source_path)
+            except OSError:
+                return QImage()
+
+        image = self._cache.load(source_path, stat)
+        if image.isNull():
+            image = read_image(source_path, self._size)
+            if not image.isNull():
+                self._cache.store(source_path, stat, image)
+        return image
+
+
+class cover_loader(QObject):
+    # Decodes cover images at thumbnail size on a thread pool, going through
+    # the on-disk thumbnail cache first. A cover file that does not exist
+    # falls back to the embedded art registered for it, extracted only
+    # when the cover is requested. Results are kept as QPixmaps in
+    # QPixmapCache; covers that do not exist or cannot be decoded are
+    # remembered as missing.
+    loaded = pyqtSignal(str, QImage)
+
+    def __init__(self, size, parent=None):
+        super(cover_loader, self).__init__(parent)
+
+        QPixmapCache.setCacheLimit(PIXMAP_CACHE_LIMIT)
+
+        self._size = QSize(size, size)
+        self._cache = thumbnail_cache(size)
+        self._pool = QThreadPool(self)
+        self._pool.setMaxThreadCount(QThread.idealThreadCount())
+        self._pending = {}
+        self._missing = set()
+        self._embedded_art = {}
+        self._priorities = itertools.count(1)
+
+        self.loaded.connect(self._on_loaded)
+
+    def find(self, file_path):
+        # returns the scaled cover, a null pixmap for a missing cover or
+        # None if it has not been loaded yet.
+        if file_path in self._missing:
+            return QPixmap()
+        return QPixmapCache.find(file_path)
+
+    def request(self, file_path, visible=True, callback=None):
+        # Visible covers get increasing priorities so that the cells shown
+        # most recently are decoded first.
+        priority = next(self._priorities) if visible else LOW_PRIORITY
+
+        if file_path in self._pending:
+            task, task_priority, callbacks = self._pending[file_path]
+            if callback is not None:
+                callbacks.append(callback)
+            if priority > task_priority and self._pool.tryTake(task):
+                self._pool.start(task, priority)
+                self._pending[file_path] = (task, priority, callbacks)
+            return
+
+        task = _cover_load_task(self, file_path, self._size, self._cache)
+        self._pending[file_path] = (task, priority, [callback] if callback is not None else [])
+        self._pool.start(task, priority)
+
+    def set_embedded_art(self, file_path, mp3_file_path):
+        # Returns True if the cover had been loaded as missing; it has to be
+        # requested again.
+        self._embedded_art[file_path] = mp3_file_path
+        if file_path in self._missing:
+            self.invalidate(file_path)
+            return True
+        return False
+
+    def embedded_art_path(self, file_path):
+        return self._embedded_art.get(file_path)
+
+    def invalidate(self, file_path):
+        QPixmapCache.remove(file_path)
+        self._missing.discard(file_path)
+        self._cache.invalidate(file_path)
+
+    @pyqtSlot(str, QImage)
+    def _on_loaded(self, file_path, image):
+        _, _, callbacks = self._pending.pop(file_path, (None, None, []))
+
+        if image.isNull():
+            self._missing.add(file_path)
+            pixmap = QPixmap()
+        else:
+            pixmap = QPixmap.fromImage(image)
+            QPixmapCache.insert(file_path, pixmap)
+
+        for callback in callbacks:
+            try:
+                callback(pixmap)
+            except RuntimeError:
+                # the widget that asked for the cover has been deleted
+                pass
+
+
+_cover_loader = None
+
+
+def get_cover_loader(size):
+    global _cover_loader
+    if _cover_loader is None:
+        _cover_loader = cover_loader(size)
+    return _cover_loader
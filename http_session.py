@@ -0,0 +1,106 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+CONNECT_TIMEOUT = 5 # sec
+READ_TIMEOUT = 15 # sec
+MAX_RETRIES = 2
+RETRY_BACKOFF_FACTOR = 0.5
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+POOL_CONNECTIONS = 32 # hosts whose connection pools are kept
+MAX_CONCURRENT_REQUESTS = int(os.environ.get('ALBUM_COVER_SEARCH_MAX_REQUESTS', 16))
+POOL_MAXSIZE = MAX_CONCURRENT_REQUESTS # kept-alive connections per host
+
+
+class host_rate_limiter(object):
+    # Spaces requests to the same host at least 1 / rate seconds apart.
+    # rate None disables the limit.
+
+    def __init__(self, rate=None):
+        self._rate = rate
+        self._next_times = {}
+        self._lock = threading.Lock()
+
+    def set_rate(self, rate):
+        with self._lock:
+            self._rate = rate
+
+    def wait(self, url):
+        with self._lock:
+            if self._rate is None:
+                return
+            host = urlsplit(url).netloc
+            now = time.monotonic()
+            start_time = max(now, self._next_times.get(host, now))
+            self._next_times[host] = start_time + 1.0 / self._rate
+        if start_time > now:
+            time.sleep(start_time - now)
+
+
+class http_session(object):
+    # One requests.Session shared by all download threads: keep-alive
+    # connections are pooled per host by urllib3, every request gets
+    # connect/read timeouts, failed connects and retryable statuses are
+    # retried with exponential backoff, and at most max_concurrent_requests
+    # requests (including reading their bodies) are in flight at once.
+    # Requests can additionally be rate limited per host.
+
+    def __init__(self, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 max_retries=MAX_RETRIES, backoff_factor=RETRY_BACKOFF_FACTOR,
+                 max_concurrent_requests=MAX_CONCURRENT_REQUESTS,
+                 pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE):
+        self._timeout = (connect_timeout, read_timeout)
+        self._semaphore = threading.BoundedSemaphore(max_concurrent_requests)
+        self._rate_limiter = host_rate_limiter()
+
+        retry = Retry(total=max_retries, backoff_factor=backoff_factor,
+                      status_forcelist=RETRY_STATUSES, allowed_methods=frozenset(['GET', 'HEAD']),
+                      raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                              max_retries=retry)
+        self._session = requests.Session()
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+
+    def set_host_rate(self, rate):
+        # requests per second per host, None for no limit
+        self._rate_limiter.set_rate(rate)
+
+    @contextmanager
+    def get(self, url, params=None, stream=False, headers=None):
+        self._rate_limiter.wait(url)
+        with self._semaphore:
+            response = self._session.get(url, params=params, stream=stream,
+                                         headers=headers, timeout=self._timeout)
+            try:
+                yield response
+            finally:
+                response.close()
+
+    def get_text(self, url, params=None):
+        # error pages (also after the retries ran out) are not result pages
+        with self.get(url, params=params) as response:
+            response.raise_for_status()
+            return response.text
+
+    def close(self):
+        self._session.close()
+
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+
+def get_http_session():
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            _http_session = http_session()
+        return _http_session
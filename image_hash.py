@@ -0,0 +1,60 @@
+import numpy as np
+
+from PyQt5.QtGui import QImage
+from PyQt5.QtCore import Qt
+
+
+HASH_IMAGE_SIZE = 32 # images are reduced to this square before the DCT
+HASH_DCT_SIZE = 8 # low frequencies kept, HASH_DCT_SIZE ** 2 bits per hash
+
+
+def _dct_matrix(n):
+    # orthonormal DCT-II; D @ x transforms the columns of x
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    d = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    d[0] /= np.sqrt(2.0)
+    return d.astype(np.float32)
+
+
+_DCT = _dct_matrix(HASH_IMAGE_SIZE)
+
+
+def image_to_gray_array(image):
+    # QImage -> HASH_IMAGE_SIZE x HASH_IMAGE_SIZE float32 luminance. Smooth
+    # scaling returns a 32-bit image whatever the input, so the conversion
+    # to gray comes after it.
+    small = image.scaled(HASH_IMAGE_SIZE, HASH_IMAGE_SIZE, Qt.IgnoreAspectRatio,
+                         Qt.SmoothTransformation).convertToFormat(QImage.Format_Grayscale8)
+    assert small.format() == QImage.Format_Grayscale8
+    bits = small.constBits()
+    bits.setsize(small.byteCount())
+    rows = np.frombuffer(bits, np.uint8).reshape(HASH_IMAGE_SIZE, small.bytesPerLine())
+    return rows[:, :HASH_IMAGE_SIZE].astype(np.float32)
+
+
+def phash_arrays(gray_arrays):
+    # Perceptual hashes of a (n, HASH_IMAGE_SIZE, HASH_IMAGE_SIZE) stack,
+    # all images at once: 2D DCT as two matrix products, then one bit per
+    # low frequency coefficient above the median (DC excluded). Returns n
+    # uint64 hashes.
+    gray_arrays = np.asarray(gray_arrays, np.float32)
+    dct = _DCT @ gray_arrays @ _DCT.T
+    low = dct[:, :HASH_DCT_SIZE, :HASH_DCT_SIZE].reshape(len(gray_arrays), -1)
+    medians = np.median(low[:, 1:], axis=1)
+    bits = low > medians[:, None]
+    return np.packbits(bits, axis=1).view('>u8').ravel().astype(np.uint64)
+
+
+def phash_images(images):
+    if len(images) == 0:
+        return np.empty(0, np.uint64)
+    return phash_arrays([image_to_gray_array(image) for image in images])
+
+
+def hamming_distances(hash_value, hashes):
+    # number of differing bits between hash_value and each of hashes
+    xor = np.bitwise_xor(np.asarray(hashes, np.uint64), np.uint64(hash_value))
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(xor).astype(np.int64)
+    return np.unpackbits(xor.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
@@ -0,0 +1,70 @@
+import struct
+
+
+# JPEG start-of-frame markers carry the image size; C4 (DHT), C8 (JPG) and
+# CC (DAC) share the range but are not frames.
+_JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+# markers without a length field
+_JPEG_STANDALONE_MARKERS = set(range(0xD0, 0xDA)) | {0x01}
+
+
+_SIGNATURES = (b'\xff\xd8\xff', b'\x89PNG\r\n\x1a\n', b'GIF87a', b'GIF89a', b'BM')
+_JPEG_SOS_MARKER = 0xDA # image data follows; a frame header must come before it
+
+NEED_MORE_DATA = 'need more data'
+
+
+def parse_image_header(data):
+    # Returns (format, width, height) from the first bytes of an image,
+    # NEED_MORE_DATA when they end before the size, or None when the format
+    # is unknown or the header invalid. format is the name
+    # QImage.loadFromData expects.
+    if len(data) < 8 and any(s.startswith(bytes(data)) for s in _SIGNATURES):
+        return NEED_MORE_DATA
+    if data[:3] == b'\xff\xd8\xff':
+        return _parse_jpeg_header(data)
+    elif data[:8] == b'\x89PNG\r\n\x1a\n':
+        if len(data) < 24:
+            return NEED_MORE_DATA
+        if data[12:16] != b'IHDR':
+            return None
+        width, height = struct.unpack('>II', data[16:24])
+        return 'PNG', width, height
+    elif data[:6] in (b'GIF87a', b'GIF89a'):
+        if len(data) < 10:
+            return NEED_MORE_DATA
+        width, height = struct.unpack('<HH', data[6:10])
+        return 'GIF', width, height
+    elif data[:2] == b'BM':
+        if len(data) < 26:
+            return NEED_MORE_DATA
+        width, height = struct.unpack('<ii', data[18:26])
+        return 'BMP', width, abs(height)
+    return None
+
+
+def _parse_jpeg_header(data):
+    # Walks the segments up to the frame header. APPn segments (EXIF with
+    # thumbnails, ICC profiles, Photoshop blocks) can take far more than
+    # the first few KB, so running out of data is not an error.
+    pos = 2
+    while pos + 4 <= len(data):
+        if data[pos] != 0xFF:
+            return None
+        marker = data[pos + 1]
+        if marker == 0xFF: # fill byte
+            pos += 1
+            continue
+        if marker in _JPEG_STANDALONE_MARKERS:
+            pos += 2
+            continue
+        if marker == _JPEG_SOS_MARKER:
+            return None
+        if marker in _JPEG_SOF_MARKERS:
+            if pos + 9 > len(data):
+                return NEED_MORE_DATA
+            height, width = struct.unpack('>HH', data[(pos + 5):(pos + 9)])
+            return 'JPG', width, height
+        segment_length = struct.unpack('>H', data[(pos + 2):(pos + 4)])[0]
+        pos += 2 + segment_length
+    return NEED_MORE_DATA
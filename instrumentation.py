@@ -0,0 +1,126 @@
+import os
+import json
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+
+METRICS_PATH = os.environ.get('ALBUM_COVER_SEARCH_METRICS') # JSON lines output, off if unset
+N_RECENT_SAMPLES = 1000 # durations kept per timer for percentiles
+
+
+class _timer_stats(object):
+    __slots__ = ('count', 'total', 'max', 'recent')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=N_RECENT_SAMPLES)
+
+
+def percentile(sorted_values, q):
+    if len(sorted_values) == 0:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+class metrics(object):
+    # Thread-safe timers and counters. Timers keep count, total and max
+    # plus the most recent durations for percentiles; counters are plain
+    # sums (e.g. bytes). With a path every timer and counter event is also
+    # appended there as one JSON line.
+
+    def __init__(self, path=None):
+        self._lock = threading.Lock()
+        self._timers = {}
+        self._counters = {}
+        self._file = None
+        if path is not None:
+            path_dir = os.path.dirname(path)
+            if path_dir != '':
+                os.makedirs(path_dir, exist_ok=True)
+            self._file = open(path, 'a', encoding='utf-8')
+
+    @contextmanager
+    def timer(self, name, **fields):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - t0, **fields)
+
+    def add_time(self, name, duration, **fields):
+        with self._lock:
+            stats = self._timers.get(name)
+            if stats is None:
+                stats = self._timers[name] = _timer_stats()
+            stats.count += 1
+            stats.total += duration
+            stats.max = max(stats.max, duration)
+            stats.recent.append(duration)
+            self._write(dict(fields, name=name, duration=duration))
+
+    def count(self, name, n=1, **fields):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+            self._write(dict(fields, name=name, value=n))
+
+    def _write(self, record):
+        if self._file is not None:
+            record['time'] = time.time()
+            self._file.write(json.dumps(record) + '\n')
+            self._file.flush()
+
+    def snapshot(self):
+        # {'timers': {name: {count, total, max, p50, p95}}, 'counters': {name: n}}
+        with self._lock:
+            timers = {}
+            for name, stats in self._timers.items():
+                recent = sorted(stats.recent)
+                timers[name] = {'count': stats.count, 'total': stats.total, 'max': stats.max,
+                                'p50': percentile(recent, 0.5), 'p95': percentile(recent, 0.95)}
+            return {'timers': timers, 'counters': dict(self._counters)}
+
+    def summary(self):
+        snapshot = self.snapshot()
+        lines = ['{:<28} {:>8} {:>10} {:>10} {:>10} {:>10}'.format(
+            'timer', 'count', 'total[s]', 'p50[ms]', 'p95[ms]', 'max[ms]')]
+        for name, t in sorted(snapshot['timers'].items()):
+            lines.append('{:<28} {:>8} {:>10.3f} {:>10.1f} {:>10.1f} {:>10.1f}'.format(
+                name, t['count'], t['total'], t['p50'] * 1000, t['p95'] * 1000, t['max'] * 1000))
+        if len(snapshot['counters']) != 0:
+            lines.append('')
+            lines.append('{:<28} {:>8}'.format('counter', 'value'))
+            for name, value in sorted(snapshot['counters'].items()):
+                lines.append('{:<28} {:>8}'.format(name, value))
+        return '\n'.join(lines)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics():
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = metrics(METRICS_PATH)
+        return _metrics
+
+
+def set_metrics_path(path):
+    # replaces the shared metrics, e.g. from a command line option
+    global _metrics
+    with _metrics_lock:
+        if _metrics is not None:
+            _metrics.close()
+        _metrics = metrics(path)
+        return _metrics
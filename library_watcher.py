@@ -0,0 +1,62 @@
+import os
+
+from PyQt5.QtCore import QObject, QTimer, QFileSystemWatcher, pyqtSignal, pyqtSlot
+
+
+DEBOUNCE_INTERVAL = 1000 # msec
+
+
+class library_watcher(QObject):
+    # Watches every directory of the library (QFileSystemWatcher is not
+    # recursive) and reports the directories whose entries changed, in
+    # batches once no change has come in for DEBOUNCE_INTERVAL. A copy or
+    # an extraction touching many files ends up as one batch.
+    dirs_changed = pyqtSignal(object)
+
+    def __init__(self, parent=None, debounce_interval=DEBOUNCE_INTERVAL):
+        super(library_watcher, self).__init__(parent)
+
+        self._watched_dirs = set()
+        self._changed_dirs = set()
+
+        self._watcher = QFileSystemWatcher(self)
+        self._watcher.directoryChanged.connect(self._on_directory_changed)
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(debounce_interval)
+        self._timer.timeout.connect(self._flush)
+
+    @property
+    def watched_dirs(self):
+        return frozenset(self._watched_dirs)
+
+    def watch(self, dir_paths):
+        new_dirs = [p for p in dir_paths if p not in self._watched_dirs]
+        if len(new_dirs) == 0:
+            return
+        failed = set(self._watcher.addPaths(new_dirs))
+        if len(failed) != 0:
+            print('cannot watch {} directories (e.g. {})'.format(len(failed), next(iter(failed))))
+        self._watched_dirs.update(p for p in new_dirs if p not in failed)
+
+    def unwatch_tree(self, root):
+        # stops watching root and the directories below it
+        prefix = os.path.join(root, '')
+        dir_paths = [p for p in self._watched_dirs if p == root or p.startswith(prefix)]
+        if len(dir_paths) == 0:
+            return
+        self._watcher.removePaths(dir_paths) # Qt may have dropped some already
+        self._watched_dirs.difference_update(dir_paths)
+
+    @pyqtSlot(str)
+    def _on_directory_changed(self, dir_path):
+        # a removed directory is dropped from the watcher by Qt
+        if not os.path.isdir(dir_path):
+            self._watched_dirs.discard(dir_path)
+        self._changed_dirs.add(dir_path)
+        self._timer.start()
+
+    def _flush(self):
+        changed_dirs, self._changed_dirs = self._changed_dirs, set()
+        self.dirs_changed.emit(sorted(changed_dirs))
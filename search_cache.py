@@ -0,0 +1,125 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+
+SEARCH_CACHE_TTL = 7 * 24 * 60 * 60 # sec
+MEMORY_CACHE_BYTES = 64 * 1024 * 1024
+
+
+class lru_byte_cache(object):
+    # LRU map bounded by the total size of its values in bytes
+
+    def __init__(self, max_bytes):
+        self._max_bytes = max_bytes
+        self._n_bytes = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._items:
+                return None
+            self._items.move_to_end(key)
+            return self._items[key][0]
+
+    def put(self, key, value, n_bytes):
+        if n_bytes > self._max_bytes:
+            return
+        with self._lock:
+            if key in self._items:
+                self._n_bytes -= self._items.pop(key)[1]
+            self._items[key] = (value, n_bytes)
+            self._n_bytes += n_bytes
+            while self._n_bytes > self._max_bytes:
+                _, (_, size) = self._items.popitem(last=False)
+                self._n_bytes -= size
+
+
+class search_cache(object):
+    # Two tiers: an in-memory LRU in front of an SQLite store that keeps the
+    # image URLs found on each search page and the downloaded image bytes.
+    # Disk entries older than ttl are ignored and purged on open.
+
+    def __init__(self, db_path, ttl=SEARCH_CACHE_TTL,
+                 memory_bytes=MEMORY_CACHE_BYTES):
+        self._ttl = ttl
+        self._memory = lru_byte_cache(memory_bytes)
+        self._lock = threading.Lock()
+        self._conn = None
+        try:
+            self._conn = self._open(db_path)
+        except (OSError, sqlite3.Error) as e:
+            print('search cache unavailable, memory only: {}'.format(e))
+
+    def _open(self, db_path):
+        db_dir = os.path.dirname(db_path)
+        if db_dir != '':
+            os.makedirs(db_dir, exist_ok=True)
+
+        conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS pages (
+                key TEXT PRIMARY KEY,
+                urls TEXT NOT NULL,
+                created REAL NOT NULL
+            )''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS images (
+                url TEXT PRIMARY KEY,
+                data BLOB NOT NULL,
+                created REAL NOT NULL
+            )''')
+        expired = time.time() - self._ttl
+        conn.execute('DELETE FROM pages WHERE created < ?', (expired,))
+        conn.execute('DELETE FROM images WHERE created < ?', (expired,))
+        conn.commit()
+        return conn
+
+    def get_page(self, key):
+        urls = self._memory.get(('page', key))
+        if urls is None:
+            row = self._select('SELECT urls FROM pages WHERE key = ? AND created >= ?', key)
+            if row is not None:
+                urls = json.loads(row[0])
+                self._memory.put(('page', key), urls, len(row[0]))
+        return list(urls) if urls is not None else None
+
+    def put_page(self, key, urls):
+        data = json.dumps(urls)
+        self._memory.put(('page', key), list(urls), len(data))
+        self._insert('INSERT OR REPLACE INTO pages VALUES (?, ?, ?)', key, data)
+
+    def get_image(self, url):
+        data = self._memory.get(('image', url))
+        if data is None:
+            row = self._select('SELECT data FROM images WHERE url = ? AND created >= ?', url)
+            if row is not None:
+                data = bytes(row[0])
+                self._memory.put(('image', url), data, len(data))
+        return data
+
+    def put_image(self, url, data):
+        self._memory.put(('image', url), data, len(data))
+        self._insert('INSERT OR REPLACE INTO images VALUES (?, ?, ?)', url, sqlite3.Binary(data))
+
+    def _select(self, query, key):
+        if self._conn is None:
+            return None
+        with self._lock:
+            return self._conn.execute(query, (key, time.time() - self._ttl)).fetchone()
+
+    def _insert(self, query, key, value):
+        if self._conn is None:
+            return
+        with self._lock:
+            try:
+                self._conn.execute(query, (key, value, time.time()))
+                self._conn.commit()
+            except sqlite3.Error as e:
+                print('search cache write error: {}'.format(e))
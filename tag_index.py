@@ -0,0 +1,138 @@
+import os
+import sqlite3
+from collections import defaultdict
+
+from utils import CACHE_DIR, read_mp3_tags_batch
+
+
+TAG_INDEX_PATH = os.path.join(CACHE_DIR, 'tags.sqlite')
+QUERY_BATCH_SIZE = 500
+
+
+def _get_tree_range(root):
+    # every path below root sorts between 'root/' and 'root0'
+    prefix = os.path.join(root, '')
+    return prefix, prefix[:-1] + chr(ord(os.sep) + 1)
+
+
+class tag_index(object):
+    # Persistent cache of mp3 tags keyed by path, size and mtime.
+    # Files without usable tags are stored with NULL artist/album so that
+    # they are not re-parsed either. has_art is NULL for rows written
+    # before it was recorded; those files are read again once.
+
+    def __init__(self, db_path=TAG_INDEX_PATH):
+        db_dir = os.path.dirname(db_path)
+        if db_dir != '':
+            os.makedirs(db_dir, exist_ok=True)
+
+        self._conn = sqlite3.connect(db_path, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS tracks (
+                path TEXT PRIMARY KEY,
+                dirname TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                artist TEXT,
+                album TEXT,
+                has_art INTEGER
+            )''')
+        columns = [row[1] for row in self._conn.execute('PRAGMA table_info(tracks)')]
+        if 'has_art' not in columns:
+            self._conn.execute('ALTER TABLE tracks ADD COLUMN has_art INTEGER')
+        self._conn.execute(
+            'CREATE INDEX IF NOT EXISTS tracks_dirname ON tracks (dirname)')
+        self._conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._conn.close()
+
+    def update(self, mp3_file_paths, errors=None, art_paths=None):
+        # art_paths, if given, receives {album dir: an mp3 with embedded art}
+        stats = {}
+        for p in mp3_file_paths:
+            try:
+                st = os.stat(p)
+            except OSError:
+                continue
+            stats[p] = (st.st_size, st.st_mtime_ns)
+
+        rows = self._select(list(stats.keys()))
+        changed_paths = [p for p, stat in stats.items()
+                         if p not in rows or rows[p][:2] != stat or rows[p][4] is None]
+
+        tags, tag_errors = read_mp3_tags_batch(changed_paths)
+        if errors is not None:
+            errors.extend(tag_errors)
+
+        new_rows = []
+        for p in changed_paths:
+            artist_name, album_name, has_art = tags.get(p, (None, None, False))
+            size, mtime_ns = stats[p]
+            new_rows.append((p, os.path.dirname(p), size, mtime_ns, artist_name, album_name,
+                             int(has_art)))
+            rows[p] = (size, mtime_ns, artist_name, album_name, int(has_art))
+
+        if len(new_rows) != 0:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO tracks (path, dirname, size, mtime_ns, artist, album, has_art) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)', new_rows)
+            self._conn.commit()
+
+        artist_album_dict = defaultdict(set)
+        for p in stats:
+            _, _, artist_name, album_name, has_art = rows[p]
+            if artist_name is None:
+                continue
+            dirname = os.path.dirname(p)
+            artist_album_dict[artist_name].add((album_name, dirname))
+            if has_art and art_paths is not None:
+                art_paths.setdefault(dirname, p)
+        return artist_album_dict
+
+    def remove(self, mp3_file_paths):
+        self._conn.executemany('DELETE FROM tracks WHERE path = ?',
+                               [(p,) for p in mp3_file_paths])
+        self._conn.commit()
+
+    def remove_tree(self, root):
+        # forgets every file below root, e.g. after it was moved or deleted
+        self._conn.execute('DELETE FROM tracks WHERE path >= ? AND path < ?', _get_tree_range(root))
+        self._conn.commit()
+
+    def get_dir_paths(self, dirname):
+        # indexed paths directly inside dirname
+        return [p for p, in self._conn.execute(
+            'SELECT path FROM tracks WHERE dirname = ?', (dirname,))]
+
+    def load_artist_album_dict(self, root=None, art_paths=None):
+        query = 'SELECT path, artist, album, dirname, has_art FROM tracks WHERE artist IS NOT NULL'
+        params = ()
+        if root is not None:
+            query += ' AND path >= ? AND path < ?'
+            params = _get_tree_range(root)
+
+        artist_album_dict = defaultdict(set)
+        for p, artist_name, album_name, dirname, has_art in self._conn.execute(query, params):
+            artist_album_dict[artist_name].add((album_name, dirname))
+            if has_art and art_paths is not None:
+                art_paths.setdefault(dirname, p)
+        return artist_album_dict
+
+    def _select(self, paths):
+        rows = {}
+        for i in range(0, len(paths), QUERY_BATCH_SIZE):
+            batch = paths[i:(i + QUERY_BATCH_SIZE)]
+            query = 'SELECT path, size, mtime_ns, artist, album, has_art FROM tracks WHERE path IN ({})'.format(
+                ','.join('?' * len(batch)))
+            for p, size, mtime_ns, artist_name, album_name, has_art in self._conn.execute(query, batch):
+                rows[p] = (size, mtime_ns, artist_name, album_name, has_art)
+        return rows
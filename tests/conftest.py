@@ -0,0 +1,15 @@
+import os
+import sys
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from PyQt5.QtWidgets import QApplication
+
+
+@pytest.fixture(scope='session')
+def qt_app():
+    # image format plugins, QPainter and widgets need an application object
+    app = QApplication.instance() or QApplication([])
+    yield app
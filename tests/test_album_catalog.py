@@ -0,0 +1,57 @@
+from collections import defaultdict
+
+from album_catalog import album_catalog
+from utils import album_sort_key, iter_album_insertions
+
+
+def make_dict(albums):
+    artist_album_dict = defaultdict(set)
+    for artist_name, album_name, dirname in albums:
+        artist_album_dict[artist_name].add((album_name, dirname))
+    return artist_album_dict
+
+
+def place(catalog, albums):
+    for position, new_albums, new_keys in iter_album_insertions(catalog.keys, albums):
+        catalog.insert(position, new_albums, new_keys, [0] * len(new_albums))
+
+
+def test_add_registers_new_albums_once():
+    catalog = album_catalog()
+    albums = [('b', 'x', '/1'), ('a', 'y', '/1'), ('a', 'z', '/2')]
+    assert sorted(catalog.add(make_dict(albums))) == sorted(albums)
+    assert catalog.add(make_dict(albums[:1] + [('c', 'w', '/3')])) == [('c', 'w', '/3')]
+    assert sorted(catalog.get_dir_albums('/1')) == [('a', 'y', '/1'), ('b', 'x', '/1')]
+    assert ('a', 'z', '/2') in catalog and ('a', 'z', '/3') not in catalog
+    assert len(catalog) == 0 # nothing placed yet
+
+
+def test_names_are_interned():
+    catalog = album_catalog()
+    first = catalog.add(make_dict([(''.join(['art', 'ist']), 'x', '/1')]))[0]
+    second = catalog.add(make_dict([(''.join(['arti', 'st']), 'y', '/2')]))[0]
+    assert first[0] is second[0]
+
+
+def test_placed_albums_stay_sorted():
+    catalog = album_catalog()
+    albums = [('Artist {}'.format(i % 7), 'Album {}'.format(i), '/{}'.format(i))
+              for i in range(50)]
+    place(catalog, catalog.add(make_dict(albums[:20])))
+    place(catalog, catalog.add(make_dict(albums[20:])))
+    assert list(catalog) == sorted(albums, key=album_sort_key)
+    assert catalog.keys == [album_sort_key(a) for a in catalog]
+
+
+def test_find_and_pop_with_equal_keys():
+    catalog = album_catalog()
+    albums = [('abc', 'x', '/d'), ('ABC', 'x', '/d'), ('Abc', 'x', '/d')]
+    place(catalog, catalog.add(make_dict(albums)))
+    for album in albums:
+        assert catalog[catalog.find(album)] == album
+    assert catalog.pop(catalog.find(('Abc', 'x', '/d'))) == ('Abc', 'x', '/d')
+    catalog.discard([('Abc', 'x', '/d')])
+    assert catalog.find(('Abc', 'x', '/d')) is None
+    assert sorted(catalog.get_dir_albums('/d')) == [('ABC', 'x', '/d'), ('abc', 'x', '/d')]
+    catalog.discard([('ABC', 'x', '/d'), ('abc', 'x', '/d')])
+    assert catalog.get_dir_albums('/d') == []
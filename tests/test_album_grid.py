@@ -0,0 +1,127 @@
+import os
+from collections import defaultdict
+
+import pytest
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QPixmap
+
+import ui
+
+
+def make_dict(albums):
+    artist_album_dict = defaultdict(set)
+    for artist_name, album_name, dirname in albums:
+        artist_album_dict[artist_name].add((album_name, dirname))
+    return artist_album_dict
+
+
+def grid_albums(w):
+    grid = w._album_grid
+    albums = []
+    for i in range(grid.count()):
+        item = grid.itemAtPosition(i // ui.N_COLS, i % ui.N_COLS)
+        assert item is not None and not item.widget().isHidden()
+        albums.append(item.widget().album_info)
+    return albums
+
+
+def model_albums(w):
+    model = w._album_model
+    return [tuple(model.index(i).data(role) for role in
+                  (ui.ARTIST_ROLE, ui.ALBUM_ROLE, ui.ALBUM_DIR_ROLE))
+            for i in range(model.rowCount())]
+
+
+@pytest.mark.parametrize('virtualized', [True, False])
+def test_filter_insert_and_remove(qt_app, virtualized):
+    artists = ['Alpha', 'Beta', 'Gamma']
+    albums = [(artists[i % 3], 'Album {}'.format(i), '/{}'.format(i)) for i in range(30)]
+    w = ui.main_widget(virtualized=virtualized, watch=False)
+    shown = model_albums if virtualized else grid_albums
+    w.add_albums(make_dict(albums))
+    assert shown(w) == sorted(albums)
+
+    w._filter_edit.setText('b')
+    w._filter_edit.setText('beta')
+    w._filter_edit.setText('beta album 1')
+    assert shown(w) == sorted(a for a in albums if a[0] == 'Beta' and a[1].startswith('Album 1'))
+
+    w._filter_edit.setText('beta')
+    new_albums = [('Beta', 'Album 0a', '/0a'), ('Gamma', 'Album 99', '/99')]
+    w.add_albums(make_dict(new_albums))
+    w._remove_albums({('Beta', 'Album 4', '/4')})
+    library = sorted(set(albums + new_albums) - {('Beta', 'Album 4', '/4')})
+    assert shown(w) == [a for a in library if a[0] == 'Beta']
+
+    w._filter_edit.setText('')
+    assert shown(w) == library
+
+
+def test_failed_search_releases_the_search_state(qt_app, monkeypatch):
+    def failing_search(artist_name, album_name, on_result):
+        raise RuntimeError('search failed')
+
+    monkeypatch.setattr(ui, 'exec_cover_search', failing_search)
+    w = ui.main_widget(watch=False)
+    w.add_albums(make_dict([('Alpha', 'Album', '/nonexistent/1')]))
+    with pytest.raises(RuntimeError):
+        w._search_cover_image(w._album_model.index(0))
+    assert not w._search_state.active
+    assert w._album_view.isEnabled()
+
+
+def test_rows_change_during_a_search(qt_app, monkeypatch, tmp_path):
+    albums = [('Artist {:02}'.format(i), 'Album', str(tmp_path / str(i))) for i in range(20)]
+    for album in albums:
+        os.mkdir(album[2])
+    w = ui.main_widget(watch=False)
+    w.add_albums(make_dict(albums))
+    w._missing_cover_check.setChecked(True)
+
+    def search(artist_name, album_name, on_result):
+        w._filter_edit.setText('artist 01')
+        cover = QPixmap(10, 10)
+        cover.fill(Qt.red)
+        on_result(cover)
+
+    monkeypatch.setattr(ui, 'exec_cover_search', search)
+    w._search_cover_image(w._album_model.index(19))
+    assert os.path.exists(os.path.join(albums[19][2], 'cover.jpg'))
+    assert albums[19] not in w._album_index.search('', True)
+    assert model_albums(w) == [albums[1]]
+
+
+def test_albums_sharing_a_dir(qt_app):
+    albums = [('Alpha', 'Disc 1', '/shared'), ('Alpha', 'Disc 2', '/shared'),
+              ('Beta', 'Album', '/other')]
+    w = ui.main_widget(virtualized=False, watch=False)
+    w.add_albums(make_dict(albums))
+    assert len(w._cover_widgets['/shared/cover.jpg']) == 2
+
+    w._update_dir_albums('/shared', {'Alpha': {('Disc 2', '/shared')}})
+    assert grid_albums(w) == [albums[1], albums[2]]
+    w._update_dir_albums('/shared', {})
+    assert grid_albums(w) == [albums[2]]
+    assert '/shared/cover.jpg' not in w._cover_widgets
+
+
+def test_widget_search_updates_the_missing_cover_facet(qt_app, monkeypatch, tmp_path):
+    albums = [('Alpha', 'Album', str(tmp_path / 'a')), ('Beta', 'Album', str(tmp_path / 'b'))]
+    for album in albums:
+        os.mkdir(album[2])
+    w = ui.main_widget(virtualized=False, watch=False)
+    w.add_albums(make_dict(albums))
+    w._missing_cover_check.setChecked(True)
+    assert grid_albums(w) == albums
+
+    def search(artist_name, album_name, on_result):
+        cover = QPixmap(10, 10)
+        cover.fill(Qt.red)
+        on_result(cover)
+
+    monkeypatch.setattr(ui, 'exec_cover_search', search)
+    w._album_widgets[0].cover._search_cover_image('Alpha', 'Album')
+    assert albums[0] not in w._album_index.search('', True)
+    w._missing_cover_check.setChecked(False)
+    w._missing_cover_check.setChecked(True)
+    assert grid_albums(w) == albums[1:]
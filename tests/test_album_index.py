@@ -0,0 +1,94 @@
+from album_index import album_index, normalize_tokens
+
+ALBUMS = [
+    ('Beyoncé', 'Lemonade', '/1'),
+    ('Mötley Crüe', 'Dr. Feelgood', '/2'),
+    ('Sigur Rós', 'Takk...', '/3'),
+    ('The Beatles', 'Abbey Road', '/4'),
+    ('Beach House', 'Bloom', '/5'),
+    ('宇多田ヒカル', '初恋', '/6'),
+]
+
+
+def make_index():
+    index = album_index()
+    index.add(ALBUMS)
+    return index
+
+
+def search(index, query, missing_cover_only=False):
+    matches = index.search(query, missing_cover_only)
+    return None if matches is None else sorted(matches)
+
+
+def test_normalize_tokens():
+    assert normalize_tokens('Mötley Crüe') == ['motley', 'crue']
+    assert normalize_tokens('  Dr. FEELGOOD ') == ['dr', 'feelgood']
+
+
+def test_empty_query_filters_nothing():
+    assert make_index().search('  ') is None
+
+
+def test_prefixes_of_any_length():
+    index = make_index()
+    assert search(index, 'b') == sorted(a for a in ALBUMS if a[2] in ('/1', '/4', '/5'))
+    assert search(index, 'be') == sorted(a for a in ALBUMS if a[2] in ('/1', '/4', '/5'))
+    assert search(index, 'bea') == sorted(a for a in ALBUMS if a[2] in ('/4', '/5'))
+    assert search(index, 'beatles') == [ALBUMS[3]]
+    assert search(index, 'beatlesque') == []
+
+
+def test_case_and_accents_are_ignored():
+    index = make_index()
+    assert search(index, 'BEYONCE') == [ALBUMS[0]]
+    assert search(index, 'motley') == [ALBUMS[1]]
+    assert search(index, 'rós') == [ALBUMS[2]]
+
+
+def test_every_query_token_has_to_match():
+    index = make_index()
+    assert search(index, 'the road') == [ALBUMS[3]]
+    assert search(index, 'beach road') == []
+
+
+def test_unspaced_scripts_match_inside_words():
+    index = make_index()
+    assert search(index, 'ヒカル') == [ALBUMS[5]]
+    assert search(index, '恋') == [ALBUMS[5]]
+
+
+def test_missing_cover_facet():
+    index = make_index()
+    index.set_has_cover('/4', True)
+    assert ALBUMS[3] not in search(index, '', missing_cover_only=True)
+    assert search(index, 'bea', missing_cover_only=True) == [ALBUMS[4]]
+    index.set_has_cover('/4', False)
+    assert search(index, 'bea', missing_cover_only=True) == sorted([ALBUMS[3], ALBUMS[4]])
+
+
+def test_added_albums_keep_their_cover_state():
+    index = album_index()
+    index.set_has_cover('/7', True)
+    index.add([('Bloc Party', 'Silent Alarm', '/7')])
+    assert search(index, '', missing_cover_only=True) == []
+
+
+def test_remove():
+    index = make_index()
+    index.remove([ALBUMS[3], ('Nobody', 'Nothing', '/0')])
+    assert len(index) == len(ALBUMS) - 1
+    assert index.get_id(ALBUMS[3]) is None
+    assert search(index, 'bea') == [ALBUMS[4]]
+    assert search(index, 'abbey') == []
+    index.add([ALBUMS[3]])
+    assert search(index, 'abbey') == [ALBUMS[3]]
+
+
+def test_matches():
+    index = make_index()
+    matches = index.search('be')
+    assert len(matches) == 3
+    assert ALBUMS[0] in matches and ALBUMS[1] not in matches
+    assert index.get_id(ALBUMS[0]) in matches.ids
+    assert index.get_album(index.get_id(ALBUMS[0])) == ALBUMS[0]
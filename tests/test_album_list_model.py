@@ -0,0 +1,50 @@
+from album_index import album_index
+from album_catalog import album_catalog
+from ui import album_list_model, ARTIST_ROLE, ALBUM_ROLE, ALBUM_DIR_ROLE
+
+
+def make_model(albums):
+    index = album_index()
+    index.add(albums)
+    model = album_list_model(album_catalog(), index)
+    model.insert_albums(albums)
+    return model, index
+
+
+def rows(model):
+    return [tuple(model.index(i).data(role) for role in (ARTIST_ROLE, ALBUM_ROLE, ALBUM_DIR_ROLE))
+            for i in range(model.rowCount())]
+
+
+def test_albums_are_sorted():
+    albums = [('b', 'x', '/1'), ('A', 'y', '/2'), ('a', 'x', '/3')]
+    model, _ = make_model(albums)
+    assert rows(model) == [('a', 'x', '/3'), ('A', 'y', '/2'), ('b', 'x', '/1')]
+
+
+def test_remove_album_with_equal_key():
+    # names differing only in case sort equal; the right one goes
+    albums = [('abc', 'x', '/d'), ('ABC', 'x', '/d'), ('Abc', 'x', '/d')]
+    model, _ = make_model(albums)
+    model.remove_albums([('Abc', 'x', '/d')])
+    assert sorted(rows(model)) == sorted([('abc', 'x', '/d'), ('ABC', 'x', '/d')])
+    model.remove_albums([('ABC', 'x', '/d'), ('abc', 'x', '/d')])
+    assert rows(model) == []
+
+
+def test_filtered_rows_follow_the_catalog():
+    artists = ['Alpha', 'Beta', 'Gamma']
+    albums = [(artists[i % 3], 'Album {}'.format(i), '/{}'.format(i)) for i in range(10)]
+    model, index = make_model(albums)
+    model.set_shown_albums(index.search('beta'))
+    assert rows(model) == [a for a in sorted(albums) if a[0] == 'Beta']
+
+    new_albums = [('Beta', 'Album 10', '/10'), ('Gamma', 'Album 11', '/11')]
+    index.add(new_albums)
+    model.insert_albums(new_albums, index.search('beta'))
+    model.remove_albums([('Beta', 'Album 4', '/4')])
+    expected = [a for a in sorted(albums + new_albums) if a[0] == 'Beta' and a[2] != '/4']
+    assert rows(model) == expected
+
+    model.set_shown_albums(None)
+    assert rows(model) == [a for a in sorted(albums + new_albums) if a[2] != '/4']
@@ -0,0 +1,96 @@
+import os
+
+from PyQt5.QtCore import Qt, QBuffer, QByteArray
+from PyQt5.QtGui import QImage
+
+import ui
+import utils
+import batch_fetch
+from batch_fetch import batch_fetcher, SAVED, NOT_FOUND
+
+
+def test_progress_write_error_does_not_stop_the_batch(tmp_path, monkeypatch):
+    # the progress file's directory is a file, so every write fails
+    blocker = tmp_path / 'blocker'
+    blocker.write_text('')
+    fetcher = batch_fetcher(n_jobs=2, progress_path=str(blocker / 'progress.jsonl'))
+    statuses = {'/a': SAVED, '/b': NOT_FOUND, '/c': SAVED}
+    monkeypatch.setattr(fetcher, '_fetch_album', lambda album, cancel_event: statuses[album[2]])
+
+    results = []
+    counts = fetcher.run([('x', 'y', d) for d in sorted(statuses)],
+                         lambda artist, album, dirname, status: results.append(dirname))
+    assert counts == {SAVED: 2, NOT_FOUND: 1, batch_fetch.FAILED: 0}
+    assert sorted(results) == ['/a', '/b', '/c']
+
+
+def test_progress_resumes(tmp_path, monkeypatch):
+    progress_path = str(tmp_path / 'progress.jsonl')
+    fetcher = batch_fetcher(n_jobs=1, progress_path=progress_path)
+    monkeypatch.setattr(fetcher, '_fetch_album', lambda album, cancel_event: SAVED)
+    fetcher.run([('x', 'y', '/a')])
+    assert os.path.exists(progress_path)
+    assert fetcher.pending_albums([('x', 'y', '/a'), ('x', 'z', '/b')]) == [('x', 'z', '/b')]
+
+
+class recording_cache(object):
+    def __init__(self):
+        self.images = {}
+
+    def get_page(self, key):
+        return None
+
+    def put_page(self, key, urls):
+        pass
+
+    def get_image(self, url):
+        return self.images.get(url)
+
+    def put_image(self, url, data):
+        self.images[url] = data
+
+
+def png_bytes(size):
+    image = QImage(size, size, QImage.Format_RGB32)
+    image.fill(Qt.blue)
+    data = QByteArray()
+    buf = QBuffer(data)
+    buf.open(QBuffer.WriteOnly)
+    image.save(buf, 'PNG')
+    return bytes(data)
+
+
+def test_batch_does_not_cache_images(qt_app, tmp_path, monkeypatch):
+    cache = recording_cache()
+    monkeypatch.setattr(utils, 'get_search_cache', lambda: cache)
+    monkeypatch.setattr(utils, 'search_image_urls',
+                        lambda query_params: ['http://a/{}.png'.format(i) for i in range(3)])
+    monkeypatch.setattr(utils, 'fetch_image_bytes',
+                        lambda url, cancel_event=None: png_bytes(200))
+
+    fetcher = batch_fetcher(n_jobs=1, n_candidates=2, progress_path=os.devnull)
+    assert fetcher._fetch_album(('x', 'y', str(tmp_path)), None) == SAVED
+    assert os.path.exists(str(tmp_path / 'cover.jpg'))
+    assert cache.images == {}
+
+    # the search dialog does cache them
+    assert len(utils.download_cover_images('x', 'y', 1, 2)) == 2
+    assert len(cache.images) == 2
+
+
+def test_worker_checks_for_covers(qt_app, tmp_path, monkeypatch):
+    albums = [('x', name, str(tmp_path / name)) for name in ('cover', 'art', 'missing')]
+    for album in albums:
+        os.mkdir(album[2])
+    (tmp_path / 'cover' / 'cover.jpg').write_bytes(b'')
+    fetched = []
+    monkeypatch.setattr(batch_fetcher, 'run',
+                        lambda self, albums, on_result=None, cancel_event=None:
+                            fetched.extend(albums))
+
+    worker = ui.batch_fetch_worker(albums, {albums[1][2]: 'track.mp3'})
+    n_albums = []
+    worker.albums_found.connect(n_albums.append)
+    worker.run()
+    assert n_albums == [1]
+    assert fetched == [albums[2]]
@@ -0,0 +1,65 @@
+import time
+import threading
+
+import utils
+
+
+def test_cancel_does_not_wait_for_hanging_downloads(monkeypatch):
+    release = threading.Event()
+
+    def hanging_download(url, cancel_event=None, thumbnail_size=None, cache_image=True):
+        release.wait(10) # a stalled connection
+        return None
+
+    monkeypatch.setattr(utils, 'download_image', hanging_download)
+    cancel_event = threading.Event()
+    threading.Timer(0.2, cancel_event.set).start()
+    t0 = time.perf_counter()
+    try:
+        assert list(utils.iter_downloaded_images(['http://a/{}.jpg'.format(i) for i in range(4)],
+                                                 cancel_event, window=2)) == []
+        assert time.perf_counter() - t0 < 2
+    finally:
+        release.set()
+
+
+def test_downloads_in_flight_follow_the_images_needed(monkeypatch):
+    lock = threading.Lock()
+    state = {'in_flight': 0, 'max_in_flight': 0, 'started': 0}
+
+    def download(url, cancel_event=None, thumbnail_size=None, cache_image=True):
+        with lock:
+            state['started'] += 1
+            state['in_flight'] += 1
+            state['max_in_flight'] = max(state['max_in_flight'], state['in_flight'])
+        time.sleep(0.05)
+        with lock:
+            state['in_flight'] -= 1
+        return None if url.endswith('bad') else url
+
+    monkeypatch.setattr(utils, 'download_image', download)
+    urls = ['http://a/{}{}'.format(i, 'bad' if i % 4 == 0 else '') for i in range(40)]
+    assert len(list(utils.iter_downloaded_images(urls, max_images=5))) == 5
+    assert state['max_in_flight'] <= 5 + utils.DOWNLOAD_MARGIN
+    assert state['started'] <= 5 + 2 * utils.DOWNLOAD_MARGIN
+
+
+def test_downloads_still_running_are_stopped(monkeypatch):
+    stopped = []
+
+    def download(url, cancel_event=None, thumbnail_size=None, cache_image=True):
+        if url.endswith('0'):
+            return url
+        deadline = time.time() + 5 # a slow download, checking for cancellation
+        while not cancel_event.is_set() and time.time() < deadline:
+            time.sleep(0.01)
+        stopped.append(cancel_event.is_set())
+        return None
+
+    monkeypatch.setattr(utils, 'download_image', download)
+    urls = ['http://a/{}'.format(i) for i in range(3)]
+    assert list(utils.iter_downloaded_images(urls, max_images=1)) == ['http://a/0']
+    deadline = time.time() + 2
+    while len(stopped) < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    assert stopped == [True, True]
@@ -0,0 +1,93 @@
+import struct
+
+import pytest
+from mutagen.id3 import ID3, APIC, TPE1, TALB
+
+import utils
+
+MPEG_FRAME = b'\xff\xfb\x90\x00' + b'\x00' * 413
+
+
+def syncsafe(n):
+    return bytes([(n >> 21) & 0x7F, (n >> 14) & 0x7F, (n >> 7) & 0x7F, n & 0x7F])
+
+
+def text_tag(version, artist_name, album_name):
+    body = b''
+    for frame_id, text in (('TPE1', artist_name), ('TALB', album_name)):
+        if version == 4:
+            data = b'\x03' + text.encode('utf-8')
+            size = syncsafe(len(data))
+        else:
+            data = b'\x01' + text.encode('utf-16')
+            size = struct.pack('>I', len(data))
+        body += frame_id.encode('ascii') + size + b'\x00\x00' + data
+    return b'ID3' + bytes([version, 0, 0]) + syncsafe(len(body)) + body
+
+
+def write_mp3(path, tag=b''):
+    path.write_bytes(tag + MPEG_FRAME * 4)
+    return str(path)
+
+
+def write_v23_pictures(file_path, pictures):
+    tag = ID3()
+    tag.add(TPE1(encoding=1, text='Artist'))
+    tag.add(TALB(encoding=1, text='Album'))
+    for i, (picture_type, data) in enumerate(pictures):
+        tag.add(APIC(encoding=1, mime='image/jpeg', type=picture_type, desc=str(i), data=data))
+    tag.update_to_v23()
+    tag.save(file_path, v2_version=3)
+
+
+@pytest.mark.parametrize('version', [3, 4])
+def test_read_text_tags(tmp_path, version):
+    file_path = write_mp3(tmp_path / 'a.mp3', text_tag(version, 'Sigur Rós', 'Ágætis byrjun'))
+    assert utils.read_mp3_tag_info(file_path) == ('Sigur Rós', 'Ágætis byrjun', False)
+
+
+def test_untagged_file(tmp_path):
+    with pytest.raises(utils.tag_read_error):
+        utils.read_mp3_tag_info(write_mp3(tmp_path / 'a.mp3'))
+
+
+def test_embedded_art_prefers_the_front_cover(tmp_path):
+    file_path = write_mp3(tmp_path / 'a.mp3')
+    write_v23_pictures(file_path, [(0, b'other'), (3, b'front'), (4, b'back')])
+    assert utils.read_mp3_tag_info(file_path) == ('Artist', 'Album', True)
+    assert utils.read_embedded_art(file_path) == b'front'
+
+    write_v23_pictures(file_path, [(4, b'back'), (0, b'other')])
+    assert utils.read_embedded_art(file_path) == b'back'
+
+
+def test_embed_keeps_id3v23(tmp_path):
+    file_path = write_mp3(tmp_path / 'a.mp3', text_tag(3, 'Artist', 'Album'))
+    assert utils.embed_cover_art([file_path], b'\xff\xd8cover') == 1
+    with open(file_path, 'rb') as f:
+        assert f.read(4) == b'ID3\x03'
+    assert utils.read_mp3_tag_info(file_path) == ('Artist', 'Album', True)
+    assert utils.read_embedded_art(file_path) == b'\xff\xd8cover'
+
+
+def test_embed_into_untagged_file(tmp_path):
+    file_path = write_mp3(tmp_path / 'a.mp3')
+    assert utils.embed_cover_art([file_path], b'\xff\xd8cover') == 1
+    assert utils.read_embedded_art(file_path) == b'\xff\xd8cover'
+
+
+@pytest.mark.parametrize('tag', [
+    # v2.4 tag with the extended header flag and a 2 byte body
+    b'ID3\x04\x00\x40' + syncsafe(2) + b'\x00\x01',
+    # v2.3 frame header cut short by the end of the tag
+    b'ID3\x03\x00\x00' + syncsafe(12) + b'TPE1\x00\x00\x00\x05\x00\x00\x01\x00',
+])
+def test_malformed_tag(tmp_path, tag):
+    file_path = write_mp3(tmp_path / 'a.mp3', tag)
+    with pytest.raises(utils.tag_read_error):
+        utils.read_mp3_tag_info(file_path)
+    assert utils.read_embedded_art(file_path) is None
+
+    tags, errors = utils.read_mp3_tags_batch([file_path])
+    assert tags == {}
+    assert [e.path for e in errors] == [file_path]
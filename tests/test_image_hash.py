@@ -0,0 +1,67 @@
+import random
+
+import numpy as np
+import pytest
+from PyQt5.QtGui import QImage, QColor, QPainter
+
+from image_hash import (HASH_IMAGE_SIZE, image_to_gray_array, phash_arrays, phash_images,
+                        hamming_distances)
+from utils import DUPLICATE_HASH_DISTANCE
+
+
+def make_image(left_seed, right_seed, width=300, height=300):
+    # random blocks, drawn separately in the left and right halves
+    image = QImage(width, height, QImage.Format_RGB32)
+    image.fill(QColor(128, 128, 128))
+    painter = QPainter(image)
+    for seed, x0 in ((left_seed, 0), (right_seed, width // 2)):
+        rng = random.Random(seed)
+        for _ in range(20):
+            painter.fillRect(x0 + rng.randrange(width // 2 - 40), rng.randrange(height - 40),
+                             40, 40, QColor(rng.randrange(256), rng.randrange(256),
+                                            rng.randrange(256)))
+    painter.end()
+    return image
+
+
+def test_gray_array_is_luminance(qt_app):
+    image = QImage(100, 50, QImage.Format_RGB32)
+    image.fill(QColor(200, 200, 200))
+    array = image_to_gray_array(image)
+    assert array.shape == (HASH_IMAGE_SIZE, HASH_IMAGE_SIZE)
+    assert np.all(np.abs(array - 200) <= 1)
+
+
+def test_gray_array_covers_the_whole_image(qt_app):
+    image = QImage(200, 200, QImage.Format_RGB32)
+    image.fill(QColor(255, 255, 255))
+    painter = QPainter(image)
+    painter.fillRect(100, 0, 100, 200, QColor(0, 0, 0))
+    painter.end()
+    array = image_to_gray_array(image)
+    assert array[:, 0].mean() > 250
+    assert array[:, -1].mean() < 5
+
+
+def test_images_differing_on_the_right_get_different_hashes(qt_app):
+    hashes = phash_images([make_image(1, 2), make_image(1, 3)])
+    assert hamming_distances(hashes[0], hashes)[1] > DUPLICATE_HASH_DISTANCE
+
+
+def test_rescaled_image_is_a_duplicate(qt_app):
+    image = make_image(1, 2)
+    hashes = phash_images([image, image.scaled(150, 150)])
+    assert hamming_distances(hashes[0], hashes)[1] <= DUPLICATE_HASH_DISTANCE
+
+
+def test_batch_matches_single_hashes(qt_app):
+    images = [make_image(i, i + 100) for i in range(4)]
+    batch = phash_images(images)
+    assert [int(h) for h in batch] == [int(phash_images([image])[0]) for image in images]
+
+
+def test_hamming_distances():
+    hashes = np.array([0, 1, 3, 2 ** 64 - 1], np.uint64)
+    assert list(hamming_distances(0, hashes)) == [0, 1, 2, 64]
+    assert len(phash_images([])) == 0
+    assert phash_arrays(np.zeros((2, HASH_IMAGE_SIZE, HASH_IMAGE_SIZE))).dtype == np.uint64
@@ -0,0 +1,104 @@
+import struct
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+from PyQt5.QtCore import QBuffer, QByteArray, QIODevice, QSize
+from PyQt5.QtGui import QImage, QColor
+
+import utils
+from image_header import parse_image_header, NEED_MORE_DATA
+
+
+def encode(image, fmt):
+    data = QByteArray()
+    buf = QBuffer(data)
+    buf.open(QIODevice.WriteOnly)
+    image.save(buf, fmt)
+    return bytes(data)
+
+
+def make_image(width, height):
+    image = QImage(width, height, QImage.Format_RGB32)
+    image.fill(QColor(10, 120, 200))
+    return image
+
+
+def with_app_segment(jpeg, n_bytes):
+    # inserts APP1 segments of n_bytes in total right after SOI, like a
+    # camera EXIF block with an embedded thumbnail
+    segments = b''
+    while n_bytes > 0:
+        length = min(n_bytes, 0xFFFF - 2)
+        segments += b'\xff\xe1' + struct.pack('>H', length + 2) + b'\0' * length
+        n_bytes -= length
+    return jpeg[:2] + segments + jpeg[2:]
+
+
+@pytest.mark.parametrize('fmt, name', [('JPG', 'JPG'), ('PNG', 'PNG'), ('BMP', 'BMP')])
+def test_sizes(qt_app, fmt, name):
+    assert parse_image_header(encode(make_image(320, 200), fmt)) == (name, 320, 200)
+
+
+def test_gif():
+    data = b'GIF89a' + struct.pack('<HH', 640, 480) + b'\0' * 20
+    assert parse_image_header(data) == ('GIF', 640, 480)
+
+
+def test_jpeg_with_large_metadata(qt_app):
+    data = with_app_segment(encode(make_image(300, 400), 'JPG'), 200 * 1024)
+    assert parse_image_header(data) == ('JPG', 300, 400)
+    assert parse_image_header(data[:100 * 1024]) == NEED_MORE_DATA
+
+
+def test_truncated_headers_need_more_data(qt_app):
+    for fmt in ('JPG', 'PNG', 'BMP'):
+        data = encode(make_image(300, 400), fmt)
+        assert parse_image_header(data[:2]) == NEED_MORE_DATA
+        assert parse_image_header(data[:12]) == NEED_MORE_DATA
+    assert parse_image_header(b'GIF89a\x01') == NEED_MORE_DATA
+
+
+def test_unknown_or_invalid():
+    assert parse_image_header(b'<html><body>not found</body></html>') is None
+    assert parse_image_header(b'RIFF\0\0\0\0WEBPVP8 ') is None
+    # scan data before any frame header
+    assert parse_image_header(b'\xff\xd8\xff\xda\x00\x08' + b'\0' * 20) is None
+    assert parse_image_header(b'\xff\xd8\xff\xe0\x00\x04\0\0garbage') is None
+
+
+def test_download_reads_past_large_metadata(qt_app):
+    body = with_app_segment(encode(make_image(300, 300), 'JPG'), 150 * 1024)
+
+    class handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            data = body if self.path == '/cover.jpg' else b'<html></html>'
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/jpeg')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        base = 'http://127.0.0.1:{}'.format(server.server_address[1])
+        assert utils.fetch_image_bytes(base + '/cover.jpg') == body
+        assert utils.fetch_image_bytes(base + '/page.jpg') is None
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_decode_cover_candidate(qt_app):
+    data = encode(make_image(600, 300), 'JPG')
+    candidate = utils.cover_candidate('http://a/1.jpg', data, *parse_image_header(data), None)
+    assert utils.decode_cover_candidate(candidate).size() == QSize(600, 300)
+    thumbnail = utils.decode_cover_candidate(candidate, QSize(utils.COVER_SIZE, utils.COVER_SIZE))
+    assert thumbnail.size() == QSize(utils.COVER_SIZE, utils.COVER_SIZE // 2)
+    # a valid header in front of data that does not decode
+    broken = candidate._replace(data=data[:200])
+    assert utils.decode_cover_candidate(broken).isNull()
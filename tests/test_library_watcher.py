@@ -0,0 +1,102 @@
+import os
+
+import pytest
+from mutagen.id3 import ID3, TPE1, TALB
+from PyQt5.QtCore import QEventLoop, QTimer
+
+import ui
+from library_watcher import library_watcher
+from tag_index import tag_index
+
+MPEG_FRAME = b'\xff\xfb\x90\x00' + b'\x00' * 413
+
+
+def write_mp3(dir_path, artist_name, album_name):
+    os.makedirs(dir_path, exist_ok=True)
+    file_path = os.path.join(dir_path, 'track.mp3')
+    with open(file_path, 'wb') as f:
+        f.write(MPEG_FRAME * 4)
+    tag = ID3()
+    tag.add(TPE1(encoding=3, text=artist_name))
+    tag.add(TALB(encoding=3, text=album_name))
+    tag.save(file_path)
+
+
+def run_worker(qt_app, worker):
+    worker.wait()
+    qt_app.processEvents() # queued signals from the worker thread
+
+
+@pytest.fixture
+def library(tmp_path, monkeypatch):
+    db_path = str(tmp_path / 'tags.sqlite')
+    monkeypatch.setattr(ui, 'tag_index', lambda: tag_index(db_path))
+    root = str(tmp_path / 'library')
+    write_mp3(os.path.join(root, 'Artist', 'Album 1'), 'Artist', 'Album 1')
+    write_mp3(os.path.join(root, 'Artist', 'Album 2'), 'Artist', 'Album 2')
+    write_mp3(os.path.join(root, 'Other', 'Album'), 'Other', 'Album')
+    return root
+
+
+def scan(qt_app, w, root):
+    worker = ui.library_scan_worker([root], w)
+    w._start_scan_worker(worker)
+    run_worker(qt_app, worker)
+    w.add_albums({})
+
+
+def update(qt_app, w, dir_paths):
+    w._update_changed_dirs(dir_paths)
+    run_worker(qt_app, w._update_worker)
+    w.add_albums({})
+
+
+def test_watcher_reports_changed_dirs(qt_app, tmp_path):
+    watcher = library_watcher(debounce_interval=10)
+    watcher.watch([str(tmp_path)])
+    reported = []
+    loop = QEventLoop()
+    watcher.dirs_changed.connect(reported.append)
+    watcher.dirs_changed.connect(loop.quit)
+    QTimer.singleShot(5000, loop.quit)
+
+    os.mkdir(str(tmp_path / 'new'))
+    os.mkdir(str(tmp_path / 'newer'))
+    loop.exec()
+    assert reported == [[str(tmp_path)]]
+
+
+def test_unwatch_tree(qt_app, tmp_path):
+    dir_paths = [str(tmp_path / p) for p in ('a', 'a/b', 'ab')]
+    for p in dir_paths:
+        os.mkdir(p)
+    watcher = library_watcher()
+    watcher.watch(dir_paths)
+    watcher.unwatch_tree(str(tmp_path / 'a'))
+    assert watcher.watched_dirs == {str(tmp_path / 'ab')}
+
+
+def test_update_dir(qt_app, library):
+    w = ui.main_widget()
+    scan(qt_app, w, library)
+    album_dir = os.path.join(library, 'Artist', 'Album 2')
+    write_mp3(album_dir, 'Artist', 'Album 2 (Remaster)')
+    update(qt_app, w, [album_dir])
+    assert [a[1] for a in w._album_catalog] == ['Album 1', 'Album 2 (Remaster)', 'Album']
+
+
+def test_moved_dir(qt_app, library):
+    w = ui.main_widget()
+    scan(qt_app, w, library)
+    old_dir = os.path.join(library, 'Artist')
+    new_dir = os.path.join(library, 'Renamed')
+    os.rename(old_dir, new_dir)
+    update(qt_app, w, [library, old_dir])
+
+    assert [a[2] for a in w._album_catalog] == [os.path.join(new_dir, 'Album 1'),
+                                                os.path.join(new_dir, 'Album 2'),
+                                                os.path.join(library, 'Other', 'Album')]
+    assert not any(p.startswith(old_dir) for p in w._library_watcher.watched_dirs)
+    assert os.path.join(new_dir, 'Album 1') in w._library_watcher.watched_dirs
+    with tag_index(os.path.join(os.path.dirname(library), 'tags.sqlite')) as index:
+        assert index.get_dir_paths(os.path.join(old_dir, 'Album 1')) == []
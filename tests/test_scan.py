@@ -0,0 +1,58 @@
+import os
+
+import pytest
+
+import utils
+
+
+@pytest.fixture
+def library(tmp_path):
+    for p in ('a/1.mp3', 'a/2.MP3', 'a/cover.jpg', 'a/b/3.Mp3', 'a/b/c/4.mp3', 'a/b/notes.txt',
+              'd/5.mp3', 'loose.mp3', 'loose.wav'):
+        file_path = tmp_path / p
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        file_path.write_bytes(b'')
+    (tmp_path / 'empty').mkdir()
+    return str(tmp_path)
+
+
+def test_is_mp3_file_path():
+    assert utils.is_mp3_file_path('/x/song.mp3')
+    assert utils.is_mp3_file_path('/x/SONG.MP3')
+    assert not utils.is_mp3_file_path('/x/mp3')
+    assert not utils.is_mp3_file_path('/x/song.mp3.part')
+
+
+@pytest.mark.parametrize('n_threads', [1, 4])
+def test_iter_mp3_file_paths(library, n_threads):
+    scanned_dir_paths = []
+    file_paths = utils.iter_mp3_file_paths([library], n_threads=n_threads,
+                                           scanned_dir_paths=scanned_dir_paths)
+    assert sorted(os.path.relpath(p, library) for p in file_paths) == [
+        'a/1.mp3', 'a/2.MP3', 'a/b/3.Mp3', 'a/b/c/4.mp3', 'd/5.mp3', 'loose.mp3']
+    assert sorted(os.path.relpath(p, library) for p in scanned_dir_paths) == [
+        '.', 'a', 'a/b', 'a/b/c', 'd', 'empty']
+
+
+def test_iter_mp3_file_paths_of_dropped_files(library):
+    dropped = [os.path.join(library, p) for p in ('loose.mp3', 'loose.wav', 'd', 'missing')]
+    scanned_dir_paths = []
+    file_paths = utils.iter_mp3_file_paths(dropped, scanned_dir_paths=scanned_dir_paths)
+    assert sorted(file_paths) == [os.path.join(library, p) for p in ('d/5.mp3', 'loose.mp3')]
+    assert scanned_dir_paths == [os.path.join(library, 'd')]
+
+
+def test_unreadable_dir_is_skipped(library):
+    assert utils.scan_dir(os.path.join(library, 'missing')) == ([], [])
+
+
+@pytest.mark.parametrize('n, chunk_size, sizes', [
+    (0, 3, []),
+    (2, 3, [2]),
+    (6, 3, [3, 3]),
+    (7, 3, [3, 3, 1]),
+])
+def test_iter_chunks(n, chunk_size, sizes):
+    chunks = list(utils.iter_chunks(iter(range(n)), chunk_size))
+    assert [len(chunk) for chunk in chunks] == sizes
+    assert [x for chunk in chunks for x in chunk] == list(range(n))
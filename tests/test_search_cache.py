@@ -0,0 +1,98 @@
+import os
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+import requests
+
+import utils
+from search_cache import search_cache, lru_byte_cache
+from http_session import http_session
+
+
+def test_lru_byte_cache_evicts_least_recently_used():
+    cache = lru_byte_cache(10)
+    cache.put('a', 1, 4)
+    cache.put('b', 2, 4)
+    assert cache.get('a') == 1
+    cache.put('c', 3, 4)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+    cache.put('big', 4, 11)
+    assert cache.get('big') is None
+
+
+def test_pages_and_images_persist(tmp_path):
+    db_path = str(tmp_path / 'cache.sqlite')
+    cache = search_cache(db_path)
+    cache.put_page('q', ['http://a/1.jpg', 'http://a/2.jpg'])
+    cache.put_image('http://a/1.jpg', b'\xff\xd8data')
+
+    cache = search_cache(db_path)
+    assert cache.get_page('q') == ['http://a/1.jpg', 'http://a/2.jpg']
+    assert cache.get_image('http://a/1.jpg') == b'\xff\xd8data'
+    assert cache.get_page('other') is None
+
+
+def test_expired_entries_are_ignored(tmp_path):
+    db_path = str(tmp_path / 'cache.sqlite')
+    search_cache(db_path).put_page('q', ['http://a/1.jpg'])
+    time.sleep(0.01)
+    assert search_cache(db_path, ttl=0.001).get_page('q') is None
+
+
+class fake_session(object):
+    def __init__(self, pages):
+        self._pages = list(pages)
+        self.n_requests = 0
+
+    def get_text(self, url, params=None):
+        self.n_requests += 1
+        page = self._pages.pop(0)
+        if isinstance(page, Exception):
+            raise page
+        return page
+
+
+@pytest.fixture
+def fresh_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, '_search_cache', search_cache(str(tmp_path / 'cache.sqlite')))
+
+
+def test_empty_result_page_is_not_cached(fresh_cache, monkeypatch):
+    page = '<a href="http://img.example/cover.jpg">x</a>'
+    session = fake_session(['<html>rate limited</html>', page])
+    monkeypatch.setattr(utils, 'get_http_session', lambda: session)
+
+    assert utils.search_image_urls({'p': 'artist+album', 'b': 1}) == []
+    assert utils.search_image_urls({'p': 'artist+album', 'b': 1}) == [
+        'http://img.example/cover.jpg']
+    assert utils.search_image_urls({'p': 'artist+album', 'b': 1}) == [
+        'http://img.example/cover.jpg']
+    assert session.n_requests == 2
+
+
+def test_get_text_raises_on_error_status():
+    class handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            body = b'<a href="http://img.example/cover.jpg">x</a>'
+            self.send_response(404 if self.path.startswith('/missing') else 200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        session = http_session(max_retries=0)
+        base = 'http://127.0.0.1:{}'.format(server.server_address[1])
+        assert 'cover.jpg' in session.get_text(base + '/search')
+        with pytest.raises(requests.HTTPError):
+            session.get_text(base + '/missing')
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,61 @@
+import os
+import glob
+import hashlib
+
+from PyQt5.QtGui import QImage
+
+from utils import CACHE_DIR
+
+
+THUMBNAIL_CACHE_DIR = os.path.join(CACHE_DIR, 'thumbnails')
+THUMBNAIL_FORMAT = 'jpg'
+THUMBNAIL_QUALITY = 90
+
+
+class thumbnail_cache(object):
+    # Scaled covers on disk, one small file per cover:
+    #   <cache_dir>/<h[:2]>/<h>-<mtime_ns>-<file size>-<thumbnail size>.jpg
+    # where h is the sha1 of the cover path. A cover that is rewritten gets a
+    # new mtime and therefore misses; the old entry is removed on the next
+    # store or by invalidate().
+
+    def __init__(self, size, cache_dir=THUMBNAIL_CACHE_DIR):
+        self._size = size
+        self._cache_dir = cache_dir
+
+    def load(self, file_path, stat):
+        entry_path = self._entry_path(file_path, stat)
+        if not os.path.exists(entry_path):
+            return QImage()
+        return QImage(entry_path)
+
+    def store(self, file_path, stat, image):
+        entry_path = self._entry_path(file_path, stat)
+        try:
+            os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+            self._remove_entries(file_path)
+            tmp_path = '{}.{}.tmp'.format(entry_path, os.getpid())
+            if image.save(tmp_path, THUMBNAIL_FORMAT, THUMBNAIL_QUALITY):
+                os.replace(tmp_path, entry_path)
+        except OSError as e:
+            print('thumbnail cache write error: {}'.format(e))
+
+    def invalidate(self, file_path):
+        try:
+            self._remove_entries(file_path)
+        except OSError as e:
+            print('thumbnail cache write error: {}'.format(e))
+
+    def _path_hash(self, file_path):
+        return hashlib.sha1(file_path.encode('utf-8', 'surrogateescape')).hexdigest()
+
+    def _entry_path(self, file_path, stat):
+        h = self._path_hash(file_path)
+        name = '{}-{}-{}-{}.{}'.format(h, stat.st_mtime_ns, stat.st_size, self._size,
+                                       THUMBNAIL_FORMAT)
+        return os.path.join(self._cache_dir, h[:2], name)
+
+    def _remove_entries(self, file_path):
+        h = self._path_hash(file_path)
+        for p in glob.glob(os.path.join(self._cache_dir, h[:2], h + '-*')):
+            os.remove(p)
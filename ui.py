@@ -2,26 +2,57 @@
 # -*- coding: utf-8 -*-
 import os
 import sys
-from math import ceil
-from collections import defaultdict
+import sqlite3
+import threading
+from itertools import chain, compress
+from concurrent.futures import ThreadPoolExecutor
 
 from utils import *
+from tag_index import tag_index
+from album_index import album_index
+from album_catalog import album_catalog
+from cover_loader import get_cover_loader
+from library_watcher import library_watcher
+from instrumentation import get_metrics
+from batch_fetch import batch_fetcher, get_missing_cover_albums, SAVED
 
 from PyQt5.QtWidgets import (QApplication, QWidget, QScrollArea, QLabel, QPushButton,
-                             QHBoxLayout, QVBoxLayout, QGridLayout, QSizePolicy)
-from PyQt5.QtGui import QPixmap, QFont, QIcon
-from PyQt5.QtCore import Qt, QSize, pyqtSignal, pyqtSlot, QEventLoop
+                             QHBoxLayout, QVBoxLayout, QGridLayout, QSizePolicy,
+                             QListView, QStyledItemDelegate, QAbstractItemView, QAction,
+                             QLineEdit, QCheckBox)
+from PyQt5.QtGui import QPixmap, QFont, QIcon, QColor
+from PyQt5.QtCore import (Qt, QObject, QSize, QRect, QThread, QTimer, pyqtSignal, pyqtSlot,
+                          QEventLoop, QAbstractListModel, QModelIndex,
+                          QPersistentModelIndex)
 
 N_QUERY = 5
-COVER_SIZE = 150
+PREFETCH_DEPTH = 1 # result pages downloaded ahead of the one shown
+RANK_WINDOW = N_QUERY # unique results compared before the best one is shown
+SHOW_SEARCH_STATS = os.environ.get('ALBUM_COVER_SEARCH_STATS', '') != ''
+STATS_UPDATE_INTERVAL = 500 # msec
+EMBED_SAVED_COVERS = False # also write covers chosen in the search into the album's mp3s
 SEARCH_WINDOW_WIDTH = 1000
 SEARCH_WINDOW_HEIGHT = 250
 WINDOW_WIDTH = 780
 WINDOW_HEIGHT = 480
 N_COLS = 4
+SCAN_CHUNK_SIZE = 500
+VIRTUALIZED_GRID = True
+WATCH_LIBRARY = True # keep dropped folders up to date
+ALBUM_CELL_WIDTH = COVER_SIZE + 40
+ALBUM_CELL_HEIGHT = COVER_SIZE + 100
+NAME_HEIGHT = 40
+
+ARTIST_ROLE = Qt.UserRole
+ALBUM_ROLE = Qt.UserRole + 1
+ALBUM_DIR_ROLE = Qt.UserRole + 2
+COVER_PATH_ROLE = Qt.UserRole + 3
+LAYOUT_UPDATE_INTERVAL = 300 # msec
+MAX_REMOVED_RANGES = 200 # a filter narrowing the rows in more pieces resets them
 
 BACKGROUND_COLOR = '#F7F7F7'
 COLOR = '#444'
+PLACEHOLDER_COLOR = '#E4E4E4'
 SCROLL_BAR_STYLE = '''
     QScrollBar:vertical {
          border: 0;
@@ -56,16 +87,55 @@ SCROLL_BAR_STYLE = '''
 
 
 class main_widget(QWidget):
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, virtualized=VIRTUALIZED_GRID, watch=WATCH_LIBRARY):
         super(main_widget, self).__init__(parent)
 
-        self._artist_album_dict = defaultdict(set)
+        self._virtualized = virtualized
+        self._album_view = None
+        self._album_grid = None
+        self._album_widgets = [] # in the order of _album_catalog
+        self._shown_widgets = [] # the ones in the grid
+        self._hidden_widgets = set() # filtered out
+        self._cover_widgets = {}
+        self._search_state = search_state(self)
+        self._album_catalog = album_catalog()
+        self._art_paths = {}
+        self._pending_albums = []
+        self._scan_workers = []
+        self._tag_errors = []
+        self._fetch_worker = None
+        self._update_worker = None
+        self._changed_dirs = set()
+        self._album_index = album_index()
+        self._shown_albums = None # albums matching the filter, None is all
+        self._filter_query = ('', False)
+
+        # dropped folders are kept up to date from then on.
+        self._library_watcher = None
+        if watch:
+            self._library_watcher = library_watcher(self)
+            self._library_watcher.dirs_changed.connect(self._update_changed_dirs)
+
+        # layout rebuilds are coalesced while scan results are streaming in.
+        self._layout_timer = QTimer(self)
+        self._layout_timer.setSingleShot(True)
+        self._layout_timer.setInterval(LAYOUT_UPDATE_INTERVAL)
+        self._layout_timer.timeout.connect(self._change_layout)
 
         self.setWindowTitle('MusicFilesUI')
         self.resize(WINDOW_WIDTH, WINDOW_HEIGHT)
         self.setStyleSheet('background-color: {}'.format(BACKGROUND_COLOR))
         self.setAcceptDrops(True)
 
+        self.setContextMenuPolicy(Qt.ActionsContextMenu)
+        self._fetch_action = QAction('Fetch missing covers', self)
+        self._fetch_action.triggered.connect(self._fetch_missing_covers)
+        self.addAction(self._fetch_action)
+        self._cancel_fetch_action = QAction('Cancel fetching covers', self)
+        self._cancel_fetch_action.setEnabled(False)
+        self._cancel_fetch_action.triggered.connect(self._cancel_fetch)
+        self.addAction(self._cancel_fetch_action)
+
         vbox = QVBoxLayout(self)
         vbox.addStretch(1)
         pixmap = QPixmap('icons/d&d_icon.png')
@@ -90,66 +160,699 @@ class main_widget(QWidget):
 
     def dropEvent(self, event):
         paths = [url.toLocalFile() for url in event.mimeData().urls()]
-        file_paths = get_mp3_file_paths(paths)
-        new_dict = get_artist_album_dict(file_paths)
-        self._artist_album_dict.update(new_dict)
+        self._start_scan_worker(library_scan_worker(paths, self))
+
+    def _start_scan_worker(self, worker):
+        worker.art_found.connect(self._add_embedded_art)
+        worker.covers_checked.connect(self._set_cover_dirs)
+        worker.chunk_ready.connect(self._add_albums)
+        worker.tag_errors.connect(self._tag_errors.extend)
+        if self._library_watcher is not None:
+            worker.dirs_scanned.connect(self._library_watcher.watch)
+        worker.finished.connect(lambda w=worker: self._scan_workers.remove(w))
+        self._scan_workers.append(worker)
+        worker.start()
+
+    @pyqtSlot(object)
+    def _add_albums(self, new_dict):
+        new_albums = self._album_catalog.add(new_dict)
+        self._album_index.add(new_albums)
+        self._pending_albums.extend(new_albums)
+        if len(new_albums) != 0 and not self._layout_timer.isActive():
+            self._layout_timer.start()
+
+    def add_albums(self, artist_album_dict):
+        # Adds albums (as get_artist_album_dict returns them) and lays them
+        # out right away, without waiting for the layout timer.
+        self._add_albums(artist_album_dict)
+        self._layout_timer.stop()
+        self._change_layout()
+
+    def _remove_albums(self, albums):
+        self._album_catalog.discard(albums)
+        self._pending_albums = [a for a in self._pending_albums if a not in albums]
+
+        # the filtered rows look their albums up in the index
+        if self._album_view is not None:
+            self._album_model.remove_albums(albums)
+        elif self._album_grid is not None:
+            self._remove_album_widgets(albums)
+        self._album_index.remove(albums)
+
+    @pyqtSlot(object)
+    def _update_changed_dirs(self, dir_paths):
+        # one update at a time; changes reported meanwhile wait for it
+        self._changed_dirs.update(dir_paths)
+        if self._update_worker is not None:
+            return
+
+        changed_dirs, self._changed_dirs = sorted(self._changed_dirs), set()
+        self._update_worker = library_update_worker(changed_dirs,
+                                                    self._library_watcher.watched_dirs, self)
+        self._update_worker.dir_updated.connect(self._update_dir_albums)
+        self._update_worker.tree_removed.connect(self._remove_tree_albums)
+        self._update_worker.finished.connect(self._update_finished)
+        self._start_scan_worker(self._update_worker)
+
+    @pyqtSlot(str, object)
+    def _update_dir_albums(self, dirname, dir_dict):
+        albums = {(artist, album, album_dir)
+                  for artist, album_set in dir_dict.items() for album, album_dir in album_set}
+        removed_albums = set(self._album_catalog.get_dir_albums(dirname)) - albums
+        if len(removed_albums) != 0:
+            self._remove_albums(removed_albums)
+        self._add_albums(dir_dict)
+        self._reload_cover(os.path.join(dirname, 'cover.jpg'))
+
+    @pyqtSlot(str)
+    def _remove_tree_albums(self, root):
+        albums = set(self._album_catalog.get_tree_albums(root))
+        if len(albums) != 0:
+            self._remove_albums(albums)
+        for dirname in {album[2] for album in albums}:
+            self._art_paths.pop(dirname, None)
+        self._library_watcher.unwatch_tree(root)
+
+    def _update_finished(self):
+        self._update_worker = None
+        if len(self._changed_dirs) != 0:
+            self._update_changed_dirs([])
+
+    @pyqtSlot(object)
+    def _add_embedded_art(self, art_paths):
+        self._art_paths.update(art_paths)
+        loader = get_cover_loader(COVER_SIZE)
+        for dirname, mp3_file_path in art_paths.items():
+            self._album_index.set_has_cover(dirname, True)
+            cover_file_path = os.path.join(dirname, 'cover.jpg')
+            if loader.set_embedded_art(cover_file_path, mp3_file_path):
+                self._refresh_cover(cover_file_path)
+
+    @pyqtSlot(object)
+    def _set_cover_dirs(self, cover_dirs):
+        # {album dir: has cover.jpg}, for the missing cover filter
+        for dirname, has_cover_file in cover_dirs.items():
+            self._album_index.set_has_cover(dirname,
+                                            has_cover_file or dirname in self._art_paths)
+
+    def _reload_cover(self, cover_file_path):
+        get_cover_loader(COVER_SIZE).invalidate(cover_file_path)
+        self._refresh_cover(cover_file_path)
+
+    def _refresh_cover(self, cover_file_path):
+        if self._album_view is not None:
+            self._album_view.viewport().update()
+        else:
+            for cover in self._cover_widgets.get(cover_file_path, ()):
+                cover.reload()
 
-        if len(self._artist_album_dict) != 0:
-            self._change_layout()
+    @property
+    def tag_errors(self):
+        return self._tag_errors
+
+    def closeEvent(self, event):
+        for worker in self._scan_workers:
+            worker.requestInterruption()
+            worker.wait()
+        if self._fetch_worker is not None:
+            self._fetch_worker.cancel()
+            self._fetch_worker.wait()
+        super(main_widget, self).closeEvent(event)
+
+    def _fetch_missing_covers(self):
+        if self._fetch_worker is not None or self._search_state.blocked:
+            return
+
+        self._n_fetched = 0
+        self._n_fetch_albums = 0
+        self._fetch_action.setEnabled(False)
+        self._cancel_fetch_action.setEnabled(True)
+        self._search_state.set_batch_running(True)
+        # which albums lack a cover is checked on the worker, a stat per
+        # album is slow on network drives
+        self._fetch_worker = batch_fetch_worker(
+            list(chain(self._album_catalog, self._pending_albums)), dict(self._art_paths), self)
+        self._fetch_worker.albums_found.connect(self._set_n_fetch_albums)
+        self._fetch_worker.album_done.connect(self._cover_fetched)
+        self._fetch_worker.finished.connect(self._fetch_finished)
+        self._fetch_worker.start()
+
+    def _cancel_fetch(self):
+        # albums already being searched finish; the rest are skipped
+        if self._fetch_worker is not None:
+            self._fetch_worker.cancel()
+            self._cancel_fetch_action.setEnabled(False)
+
+    @pyqtSlot(int)
+    def _set_n_fetch_albums(self, n_albums):
+        self._n_fetch_albums = n_albums
+        self._show_fetch_progress()
+
+    @pyqtSlot(str, str)
+    def _cover_fetched(self, dirname, status):
+        self._n_fetched += 1
+        self._show_fetch_progress()
+        if status == SAVED:
+            self._album_index.set_has_cover(dirname, True)
+            self._reload_cover(os.path.join(dirname, 'cover.jpg'))
+
+    def _show_fetch_progress(self):
+        self.setWindowTitle('MusicFilesUI - fetching covers {}/{}'.format(
+            self._n_fetched, self._n_fetch_albums))
+
+    def _fetch_finished(self):
+        self._fetch_worker = None
+        self._fetch_action.setEnabled(True)
+        self._cancel_fetch_action.setEnabled(False)
+        self._search_state.set_batch_running(False)
+        self.setWindowTitle('MusicFilesUI')
 
     def _change_layout(self):
-        # clear layout
-        QWidget().setLayout(self.layout())
+        # only the albums added since the last call are inserted
+        albums, self._pending_albums = self._pending_albums, []
+        if self._shown_albums is not None:
+            self._shown_albums = self._search_albums()
+        if self._virtualized:
+            self._change_view_layout(albums)
+        else:
+            self._change_widget_layout(albums)
+
+    def _change_view_layout(self, albums):
+        if self._album_view is None:
+            QWidget().setLayout(self.layout())
+
+            self._album_model = album_list_model(self._album_catalog, self._album_index, self)
+            self._album_view = album_grid_view()
+            self._album_view.setModel(self._album_model)
+            self._album_view.clicked.connect(self._search_cover_image)
+            self._search_state.changed.connect(self._album_view.setDisabled)
+
+            vbox = QVBoxLayout(self)
+            vbox.addWidget(self._init_filter_bar())
+            vbox.addWidget(self._album_view)
+            vbox.setContentsMargins(0, 0, 0, 0)
+
+        self._album_model.insert_albums(albums, self._shown_albums)
+
+    @pyqtSlot(QModelIndex)
+    def _search_cover_image(self, index):
+        if self._search_state.blocked:
+            return
+        # The filter, drops and the watcher change the rows while the search
+        # dialog runs, so the cover path is read now and the row is tracked.
+        cover_file_path = index.data(COVER_PATH_ROLE)
+        persistent_index = QPersistentModelIndex(index)
+
+        self._search_state.begin()
+        try:
+            exec_cover_search(index.data(ARTIST_ROLE), index.data(ALBUM_ROLE),
+                              lambda cover: save_cover(cover, cover_file_path))
+        finally:
+            self._search_state.end()
+
+        self._set_saved_cover(cover_file_path)
+        if persistent_index.isValid():
+            self._album_view.update(QModelIndex(persistent_index))
+
+    @pyqtSlot(str)
+    def _set_saved_cover(self, cover_file_path):
+        # after a cover search, for the missing cover facet
+        if os.path.exists(cover_file_path):
+            self._album_index.set_has_cover(os.path.dirname(cover_file_path), True)
+
+    def _change_widget_layout(self, albums):
+        if self._album_grid is None:
+            QWidget().setLayout(self.layout())
+
+            scroll_widget = QWidget()
+            self._album_grid = QGridLayout(scroll_widget)
+            self._album_grid.setContentsMargins(0, 0, 0, 10)
+
+            scroll = QScrollArea()
+            scroll.setFixedHeight(WINDOW_HEIGHT)
+            scroll.setWidgetResizable(True)
+            bar = scroll.verticalScrollBar()
+            bar.setStyleSheet(SCROLL_BAR_STYLE)
+            scroll.setWidget(scroll_widget)
+            scroll.setAlignment(Qt.AlignCenter)
+
+            vbox = QVBoxLayout(self)
+            vbox.addWidget(self._init_filter_bar())
+            vbox.addWidget(scroll)
+            vbox.setContentsMargins(0, 0, 0, 0)
+
+        self._insert_album_widgets(albums)
+
+    def _insert_album_widgets(self, albums):
+        # New widgets are created for the new albums only. Cells after the
+        # first insertion point shift, so those are moved in the grid.
+        for position, new_albums, new_keys in iter_album_insertions(self._album_catalog.keys,
+                                                                    albums):
+            new_widgets = []
+            for artist, album, dirname in new_albums:
+                a_widget = album_widget(artist, album, dirname, state=self._search_state)
+                a_widget.cover.cover_saved.connect(self._set_saved_cover)
+                self._cover_widgets.setdefault(a_widget.cover.cover_file_path, []).append(
+                    a_widget.cover)
+                new_widgets.append(a_widget)
+            self._album_widgets[position:position] = new_widgets
+            self._album_catalog.insert(position, new_albums, new_keys,
+                                       [self._album_index.get_id(a) for a in new_albums])
+        self._show_album_widgets()
+
+    def _remove_album_widgets(self, albums):
+        for album in sorted(albums, key=album_sort_key, reverse=True):
+            position = self._album_catalog.find(album)
+            if position is None:
+                continue # still pending
+            self._album_catalog.pop(position)
+            a_widget = self._album_widgets.pop(position)
+            # albums sharing a dir share the cover path
+            covers = self._cover_widgets[a_widget.cover.cover_file_path]
+            covers.remove(a_widget.cover)
+            if len(covers) == 0:
+                del self._cover_widgets[a_widget.cover.cover_file_path]
+            self._hidden_widgets.discard(a_widget)
+            a_widget.deleteLater() # taken out of the grid below
+        self._show_album_widgets()
+
+    def _show_album_widgets(self):
+        # Lays out the widgets matching the filter. Grid items are kept in
+        # album order, so only the cells from the first one that changes
+        # are placed again. Widgets filtered out are only hidden, so
+        # clearing the filter recreates nothing.
+        if self._shown_albums is None:
+            shown_widgets = list(self._album_widgets)
+        else:
+            shown_widgets = list(compress(self._album_widgets,
+                                          map(self._shown_albums.ids.__contains__,
+                                              self._album_catalog.ids)))
+        first = 0
+        n = min(len(shown_widgets), len(self._shown_widgets))
+        while first < n and shown_widgets[first] is self._shown_widgets[first]:
+            first += 1
+
+        for i in range(self._album_grid.count() - 1, first - 1, -1):
+            self._album_grid.takeAt(i)
+        still_shown = set(shown_widgets[first:])
+        for a_widget in self._shown_widgets[first:]:
+            if a_widget not in still_shown:
+                a_widget.hide()
+                self._hidden_widgets.add(a_widget)
+        for i in range(first, len(shown_widgets)):
+            a_widget = shown_widgets[i]
+            self._album_grid.addWidget(a_widget, i // N_COLS, i % N_COLS, alignment=Qt.AlignTop)
+            if a_widget in self._hidden_widgets:
+                self._hidden_widgets.discard(a_widget)
+                a_widget.show()
+        self._shown_widgets = shown_widgets
+
+    def _init_filter_bar(self):
+        self._filter_edit = QLineEdit()
+        self._filter_edit.setPlaceholderText('Filter by artist or album')
+        self._filter_edit.setClearButtonEnabled(True)
+        self._filter_edit.setStyleSheet('color: {}; background-color: white'.format(COLOR))
+        self._filter_edit.textChanged.connect(self._filter_albums)
+
+        self._missing_cover_check = QCheckBox('Missing cover only')
+        self._missing_cover_check.setStyleSheet('color: {}'.format(COLOR))
+        self._missing_cover_check.toggled.connect(self._filter_albums)
+
+        bar = QWidget()
+        hbox = QHBoxLayout(bar)
+        hbox.setContentsMargins(10, 10, 10, 0)
+        hbox.addWidget(self._filter_edit)
+        hbox.addWidget(self._missing_cover_check)
+        return bar
+
+    def _search_albums(self):
+        return self._album_index.search(self._filter_edit.text(),
+                                        self._missing_cover_check.isChecked())
+
+    def _filter_albums(self):
+        # pending albums are filtered when they are inserted
+        query = (self._filter_edit.text(), self._missing_cover_check.isChecked())
+        narrowed = (self._shown_albums is not None and query[0].startswith(self._filter_query[0])
+                    and query[1] >= self._filter_query[1])
+        self._filter_query = query
+        self._shown_albums = self._search_albums()
+        if self._album_view is not None:
+            self._album_model.set_shown_albums(self._shown_albums, narrowed)
+        elif self._album_grid is not None:
+            self._show_album_widgets()
+
+
+class search_state(QObject):
+    # Shared "a cover search is running" flag. Covers consult it on click
+    # instead of being wired to each other. A batch fetch only blocks new
+    # searches; the grid stays usable meanwhile.
+    changed = pyqtSignal(bool)
+
+    def __init__(self, parent=None):
+        super(search_state, self).__init__(parent)
+
+        self._active = False
+        self._batch_running = False
 
-        scroll_widget = QWidget()
-        scroll_vbox = QVBoxLayout(scroll_widget)
+    @property
+    def active(self):
+        return self._active
 
-        self._init_album_layouts()
+    @property
+    def blocked(self):
+        return self._active or self._batch_running
+
+    def set_batch_running(self, running):
+        self._batch_running = running
+
+    def begin(self):
+        self._active = True
+        self.changed.emit(True)
+
+    def end(self):
+        self._active = False
+        self.changed.emit(False)
+
+
+class library_scan_worker(QThread):
+    chunk_ready = pyqtSignal(object)
+    tag_errors = pyqtSignal(object)
+    art_found = pyqtSignal(object) # {album dir: mp3 with embedded art}
+    covers_checked = pyqtSignal(object) # {album dir: has cover.jpg}
+    dirs_scanned = pyqtSignal(object)
+
+    def __init__(self, paths, parent=None):
+        super(library_scan_worker, self).__init__(parent)
+
+        self._paths = paths
+
+    def run(self):
+        index = self._open_index()
+        self._scan(index, self._paths)
+        if index is not None:
+            index.close()
+
+    def _open_index(self):
+        # the index connection has to be opened on the thread that uses it.
+        try:
+            return tag_index()
+        except (OSError, sqlite3.Error) as e:
+            print('tag index unavailable: {}'.format(e))
+            return None
+
+    def _read_tags(self, index, file_paths):
+        errors = []
+        art_paths = {}
+        if index is not None:
+            artist_album_dict = index.update(file_paths, errors, art_paths)
+        else:
+            artist_album_dict = get_artist_album_dict(file_paths, errors, art_paths)
+        if len(errors) != 0:
+            self.tag_errors.emit(errors)
+        if len(art_paths) != 0:
+            self.art_found.emit(art_paths)
+        album_dirs = {dirname for album_set in artist_album_dict.values()
+                      for _, dirname in album_set}
+        if len(album_dirs) != 0:
+            self.covers_checked.emit({dirname: os.path.exists(os.path.join(dirname, 'cover.jpg'))
+                                      for dirname in album_dirs})
+        return artist_album_dict
+
+    def _scan(self, index, paths):
+        dir_paths = []
+        file_paths = iter_mp3_file_paths(paths, scanned_dir_paths=dir_paths)
+        for chunk in iter_chunks(file_paths, SCAN_CHUNK_SIZE):
+            if self.isInterruptionRequested():
+                return
+            self.chunk_ready.emit(self._read_tags(index, chunk))
+        self.dirs_scanned.emit(dir_paths)
+
+
+class library_update_worker(library_scan_worker):
+    # Re-reads the directories reported by the library watcher, one level
+    # each: the albums now found in a directory replace the ones it had.
+    # Subdirectories that are not watched yet are new and scanned fully.
+    # A directory that is gone was moved or deleted with everything below
+    # it; its new place, if any, is reported as a new subdirectory.
+    dir_updated = pyqtSignal(str, object)
+    tree_removed = pyqtSignal(str)
+
+    def __init__(self, dir_paths, watched_dirs, parent=None):
+        super(library_update_worker, self).__init__(dir_paths, parent)
+
+        self._watched_dirs = watched_dirs
+
+    def run(self):
+        index = self._open_index()
+        for dir_path in self._paths:
+            if self.isInterruptionRequested():
+                break
+            self._update_dir(index, dir_path)
+        if index is not None:
+            index.close()
+
+    def _update_dir(self, index, dir_path):
+        if not os.path.isdir(dir_path):
+            if index is not None:
+                index.remove_tree(dir_path)
+            self.tree_removed.emit(dir_path)
+            return
+
+        file_paths, sub_dir_paths = scan_dir(dir_path)
+        if index is not None:
+            removed_paths = set(index.get_dir_paths(dir_path)) - set(file_paths)
+            if len(removed_paths) != 0:
+                index.remove(removed_paths)
+        self.dir_updated.emit(dir_path, self._read_tags(index, file_paths))
+
+        new_dir_paths = [p for p in sub_dir_paths if p not in self._watched_dirs]
+        if len(new_dir_paths) != 0:
+            self._scan(index, new_dir_paths)
+
+
+class batch_fetch_worker(QThread):
+    # Fetches covers for the albums with neither a cover.jpg nor embedded
+    # art (art_paths).
+    albums_found = pyqtSignal(int) # albums missing a cover
+    album_done = pyqtSignal(str, str) # album dir, status
+
+    def __init__(self, albums, art_paths, parent=None):
+        super(batch_fetch_worker, self).__init__(parent)
+
+        self._albums = albums
+        self._art_paths = art_paths
+        self._cancel_event = threading.Event()
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    def run(self):
+        # the UI always searches again, so no progress file is kept.
+        albums = get_missing_cover_albums(self._albums, self._art_paths)
+        self.albums_found.emit(len(albums))
+        fetcher = batch_fetcher(progress_path=os.devnull)
+        fetcher.run(albums,
+                    lambda artist_name, album_name, dirname, status:
+                        self.album_done.emit(dirname, status),
+                    self._cancel_event)
+
+
+class album_list_model(QAbstractListModel):
+    # The rows are the albums of an album_catalog matching the filter
+    # (shown_albums, None is all), in catalog order. New albums are placed
+    # in the catalog through the model. Unfiltered, the rows are the
+    # catalog itself; filtered, only the album_index ids of the matching
+    # albums are kept.
+
+    def __init__(self, catalog, index, parent=None):
+        super(album_list_model, self).__init__(parent)
+
+        self._catalog = catalog
+        self._index = index
+        self._ids = None
+
+    def _get_row_album(self, row):
+        if self._ids is None:
+            return self._catalog[row]
+        return self._index.get_album(self._ids[row])
+
+    def remove_albums(self, albums):
+        albums = sorted(albums, key=album_sort_key, reverse=True)
+        filtered = self._ids is not None
+        for album in albums:
+            position = self._catalog.find(album)
+            if position is None:
+                continue # still pending
+            if not filtered:
+                self.beginRemoveRows(QModelIndex(), position, position)
+            self._catalog.pop(position)
+            if not filtered:
+                self.endRemoveRows()
+        if not filtered:
+            return
+        for album in albums:
+            position = find_album(_row_keys(self), album, self._get_row_album)
+            if position is None:
+                continue # filtered out
+            self.beginRemoveRows(QModelIndex(), position, position)
+            del self._ids[position]
+            self.endRemoveRows()
+
+    def insert_albums(self, albums, shown_albums=None):
+        filtered = self._ids is not None
+        for position, new_albums, new_keys in iter_album_insertions(self._catalog.keys, albums):
+            new_ids = [self._index.get_id(a) for a in new_albums]
+            if not filtered:
+                self.beginInsertRows(QModelIndex(), position, position + len(new_albums) - 1)
+            self._catalog.insert(position, new_albums, new_keys, new_ids)
+            if not filtered:
+                self.endInsertRows()
+        if not filtered:
+            return
+        albums = [album for album in albums if album in shown_albums]
+        for position, new_albums, _ in iter_album_insertions(_row_keys(self), albums):
+            self.beginInsertRows(QModelIndex(), position, position + len(new_albums) - 1)
+            self._ids[position:position] = [self._index.get_id(a) for a in new_albums]
+            self.endInsertRows()
+
+    def set_shown_albums(self, shown_albums, narrowed=False):
+        # narrowed: shown_albums is a subset of the albums shown now (the
+        # query was typed further), so only the current rows are checked
+        # and the ones left out are removed, keeping the view's scroll
+        # position. Anything else resets the rows.
+        if narrowed and self._ids is not None and shown_albums is not None:
+            selected = list(map(shown_albums.ids.__contains__, self._ids))
+            removed_ranges = list(iter_false_ranges(selected))
+            if len(removed_ranges) <= MAX_REMOVED_RANGES:
+                for start, end in reversed(removed_ranges):
+                    self.beginRemoveRows(QModelIndex(), start, end - 1)
+                    del self._ids[start:end]
+                    self.endRemoveRows()
+                return
+            ids = self._ids
+        else:
+            ids = self._catalog.ids
+            if shown_albums is not None:
+                selected = list(map(shown_albums.ids.__contains__, ids))
 
-        for hbox in self._album_layouts:
-            hbox.setContentsMargins(0, 0, 0, 10)
-            scroll_vbox.addLayout(hbox)
+        self.beginResetModel()
+        if shown_albums is None:
+            self._ids = None
+        else:
+            self._ids = list(compress(ids, selected))
+        self.endResetModel()
 
-        scroll = QScrollArea()
-        scroll.setFixedHeight(WINDOW_HEIGHT)
-        bar = scroll.verticalScrollBar()
-        bar.setStyleSheet(SCROLL_BAR_STYLE)
-        scroll.setWidget(scroll_widget)
-        scroll.setAlignment(Qt.AlignCenter)
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._ids if self._ids is not None else self._catalog)
 
-        vbox = QVBoxLayout(self)
-        vbox.addWidget(scroll)
-        vbox.setContentsMargins(0, 0, 0, 0)
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
 
-    def _init_album_layouts(self):
-        n_albums = get_n_albums(self._artist_album_dict)
-        artists = sorted(list(self._artist_album_dict.keys()), key=str.lower)
-        album_widgets = []
-        for artist in artists:
-            albums = sorted([x for x in self._artist_album_dict[artist]], key=lambda x: str.lower(x[0]))
-            for album in albums:
-                album_widgets.append(album_widget(artist, album[0], album[1]))
-
-        for i in range(len(album_widgets)):
-            for j in range(len(album_widgets)):
-                if i == j:
-                    continue
+        artist_name, album_name, dirname = self._get_row_album(index.row())
+        if role == ARTIST_ROLE:
+            return artist_name
+        elif role in (ALBUM_ROLE, Qt.DisplayRole):
+            return album_name
+        elif role == ALBUM_DIR_ROLE:
+            return dirname
+        elif role == COVER_PATH_ROLE:
+            return os.path.join(dirname, 'cover.jpg')
+        return None
 
-                album_widgets[i].cover.begin_search.connect(
-                    album_widgets[j].cover.disable
-                )
-                album_widgets[i].cover.end_search.connect(
-                    album_widgets[j].cover.enable
-                )
 
-        self._album_layouts = [QHBoxLayout() for i in range(ceil(n_albums / N_COLS))]
-        for i, a_widget in enumerate(album_widgets):
-            hbox_index = i // N_COLS
-            self._album_layouts[hbox_index].addWidget(a_widget, alignment=Qt.AlignTop)
+class _row_keys(object):
+    # The album_sort_keys of a filtered album_list_model's rows, computed
+    # for the few rows a bisection looks at.
+
+    def __init__(self, model):
+        self._model = model
+
+    def __len__(self):
+        return self._model.rowCount()
+
+    def __getitem__(self, row):
+        return album_sort_key(self._model._get_row_album(row))
+
+
+class album_delegate(QStyledItemDelegate):
+    # Paints one album cell (cover + artist + album) directly, so no widgets
+    # exist per album. Covers are requested from the background loader when
+    # a cell is first painted and a placeholder is drawn until they arrive.
+
+    def __init__(self, parent=None):
+        super(album_delegate, self).__init__(parent)
+
+        self._loader = get_cover_loader(COVER_SIZE)
+
+        self._cover_font = QFont()
+        self._cover_font.setPointSize(16)
+        self._name_font = QFont()
+        self._name_font.setPointSize(12)
+
+    def paint(self, painter, option, index):
+        painter.save()
+
+        rect = option.rect
+        cover_rect = QRect(rect.x() + (rect.width() - COVER_SIZE) // 2, rect.y() + 10,
+                           COVER_SIZE, COVER_SIZE)
+        cover_file_path = index.data(COVER_PATH_ROLE)
+        cover = self._loader.find(cover_file_path)
+        if cover is None:
+            self._loader.request(cover_file_path)
+            painter.fillRect(cover_rect, QColor(PLACEHOLDER_COLOR))
+        elif not cover.isNull():
+            x = cover_rect.x() + (COVER_SIZE - cover.width()) // 2
+            y = cover_rect.y() + (COVER_SIZE - cover.height()) // 2
+            painter.drawPixmap(x, y, cover)
+        else:
+            painter.fillRect(cover_rect, QColor(COLOR))
+            painter.setPen(QColor(BACKGROUND_COLOR))
+            painter.setFont(self._cover_font)
+            painter.drawText(cover_rect, Qt.AlignCenter, 'No Cover')
+
+        painter.setPen(QColor(COLOR))
+        painter.setFont(self._name_font)
+        name_flags = Qt.AlignHCenter | Qt.AlignTop | Qt.TextWordWrap
+        artist_rect = QRect(cover_rect.x(), cover_rect.bottom() + 6, COVER_SIZE, NAME_HEIGHT)
+        used_rect = painter.drawText(artist_rect, name_flags, index.data(ARTIST_ROLE))
+        album_top = min(used_rect.bottom(), artist_rect.bottom()) + 6
+        album_rect = QRect(cover_rect.x(), album_top, COVER_SIZE, rect.bottom() - album_top)
+        painter.drawText(album_rect, name_flags, index.data(ALBUM_ROLE))
+
+        painter.restore()
+
+    def sizeHint(self, option, index):
+        return QSize(ALBUM_CELL_WIDTH, ALBUM_CELL_HEIGHT)
+
+
+class album_grid_view(QListView):
+    def __init__(self, parent=None):
+        super(album_grid_view, self).__init__(parent)
+
+        self.setViewMode(QListView.IconMode)
+        self.setMovement(QListView.Static)
+        self.setResizeMode(QListView.Adjust)
+        self.setUniformItemSizes(True)
+        self.setGridSize(QSize(ALBUM_CELL_WIDTH, ALBUM_CELL_HEIGHT))
+        self.setSelectionMode(QAbstractItemView.NoSelection)
+        self.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.setVerticalScrollMode(QAbstractItemView.ScrollPerPixel)
+        # tens of thousands of cells are laid out a batch at a time, so a
+        # filter keystroke shows its first rows without waiting for the rest
+        self.setLayoutMode(QListView.Batched)
+        self.setFrameShape(QListView.NoFrame)
+        self.verticalScrollBar().setStyleSheet(SCROLL_BAR_STYLE)
+        self.setItemDelegate(album_delegate(self))
+
+        # a repaint only redraws the visible cells from the pixmap cache
+        get_cover_loader(COVER_SIZE).loaded.connect(self.viewport().update)
 
 
 class album_widget(QWidget):
-    def __init__(self, artist_name, album_name, album_dir_name, parent=None):
+    def __init__(self, artist_name, album_name, album_dir_name, parent=None, state=None):
         super(album_widget, self).__init__(parent)
 
         self.setSizePolicy(QSizePolicy.Fixed, QSizePolicy.Fixed)
@@ -161,7 +864,7 @@ class album_widget(QWidget):
         vbox.addStretch(1)
 
         cover_image_path = os.path.join(album_dir_name, 'cover.jpg')
-        self._cover = cover_widget(cover_image_path)
+        self._cover = cover_widget(cover_image_path, state=state)
         vbox.addWidget(self._cover, alignment=Qt.AlignCenter)
 
         self._artist = name_widget(artist_name)
@@ -172,6 +875,12 @@ class album_widget(QWidget):
 
         vbox.addStretch(1)
 
+        self._album_info = (artist_name, album_name, album_dir_name)
+
+    @property
+    def album_info(self):
+        return self._album_info
+
     @property
     def cover(self):
         return self._cover
@@ -190,14 +899,16 @@ class album_widget(QWidget):
 class cover_widget(QWidget):
     begin_search = pyqtSignal()
     end_search = pyqtSignal()
+    cover_saved = pyqtSignal(str) # cover file path
 
-    def __init__(self, cover_file_path, parent=None):
+    def __init__(self, cover_file_path, parent=None, state=None):
         super(cover_widget, self).__init__(parent)
 
         self.begin_search.connect(self.disable)
         self.end_search.connect(self.enable)
 
         self._cover_file_path = cover_file_path
+        self._search_state = state if state is not None else search_state(self)
 
         self.setSizePolicy(QSizePolicy.Fixed, QSizePolicy.Fixed)
 
@@ -205,48 +916,68 @@ class cover_widget(QWidget):
         vbox.setContentsMargins(0, 0, 0, 0)
 
         self._cover_label = QLabel()
-        if os.path.exists(cover_file_path):
-            pixmap = QPixmap(cover_file_path)
-            self._set_cover(pixmap)
-        else:
-            self._cover_label.setText('No Cover')
-            self._cover_label.setAlignment(Qt.AlignCenter)
-            font = QFont()
-            font.setPointSize(16)
-            self._cover_label.setFont(font)
-            self._cover_label.setStyleSheet(
-                'color: {}; background-color: {}'.format(BACKGROUND_COLOR, COLOR))
+        self._cover_label.setFixedSize(COVER_SIZE, COVER_SIZE)
+        self._cover_label.setAlignment(Qt.AlignCenter)
         vbox.addWidget(self._cover_label)
 
+        self._loader = get_cover_loader(COVER_SIZE)
+        self._cover_requested_visible = False
+        self._load_cover(visible=False)
+
+    def _load_cover(self, visible):
+        cover = self._loader.find(self._cover_file_path)
+        if cover is not None:
+            self._set_cover(cover)
+            return
+
+        self._cover_requested_visible = visible
+        self._cover_label.setStyleSheet('background-color: {}'.format(PLACEHOLDER_COLOR))
+        self._loader.request(self._cover_file_path, visible=visible, callback=self._set_cover)
+
+    def paintEvent(self, event):
+        # only covers inside the scroll area's viewport get painted; bump
+        # their decode priority.
+        if (self._loader.find(self._cover_file_path) is None
+                and not self._cover_requested_visible):
+            self._load_cover(visible=True)
+        super(cover_widget, self).paintEvent(event)
+
     @property
     def cover_file_path(self):
         return self._cover_file_path
 
     def mousePressEvent(self, event):
+        if self._search_state.blocked:
+            return
         self._search_cover_image(self.parentWidget().artist.name,
                                  self.parentWidget().album.name)
 
     def _set_cover(self, cover):
-        p = cover.scaled(QSize(COVER_SIZE, COVER_SIZE), Qt.KeepAspectRatio)
-        self._cover_label.setPixmap(p)
+        if cover.isNull():
+            self._cover_label.setText('No Cover')
+            font = QFont()
+            font.setPointSize(16)
+            self._cover_label.setFont(font)
+            self._cover_label.setStyleSheet(
+                'color: {}; background-color: {}'.format(BACKGROUND_COLOR, COLOR))
+        else:
+            self._cover_label.setText('')
+            self._cover_label.setStyleSheet('')
+            self._cover_label.setPixmap(cover)
 
     def _search_cover_image(self, artist_name, album_name):
-        search_widget = cover_search_widget(artist_name, album_name)
-        search_widget.setWindowFlags(Qt.Tool) # Tool window is alywas on top.
-        search_widget.show()
-
-        loop = QEventLoop()
-        search_widget.canceled.connect(loop.quit)
-        search_widget.finished.connect(loop.quit)
-        search_widget.result.connect(self._save_searched_cover)
+        self._search_state.begin()
         self.begin_search.emit()
-        search_widget.search()
-        loop.exec()
-        self.end_search.emit()
+        try:
+            exec_cover_search(artist_name, album_name, self._save_searched_cover)
+        finally:
+            self.end_search.emit()
+            self._search_state.end()
 
-        if os.path.exists(self._cover_file_path):
-            pixmap = QPixmap(self._cover_file_path)
-            self._set_cover(pixmap)
+        self._load_cover(visible=True)
+
+    def reload(self):
+        self._load_cover(visible=True)
 
     @pyqtSlot()
     def enable(self):
@@ -258,12 +989,44 @@ class cover_widget(QWidget):
 
     @pyqtSlot(QPixmap)
     def _save_searched_cover(self, cover):
-        cover.save(self._cover_file_path)
+        save_cover(cover, self._cover_file_path)
+        self.cover_saved.emit(self._cover_file_path)
 
     def sizeHint(self):
         return QSize(COVER_SIZE, COVER_SIZE)
 
 
+def save_cover(cover, cover_file_path):
+    cover.save(cover_file_path)
+    get_cover_loader(COVER_SIZE).invalidate(cover_file_path)
+    if EMBED_SAVED_COVERS:
+        _cover_embed_executor.submit(_embed_saved_cover, cover_file_path)
+
+
+def _embed_saved_cover(cover_file_path):
+    with open(cover_file_path, 'rb') as f:
+        image_data = f.read()
+    mp3_file_paths, _ = scan_dir(os.path.dirname(cover_file_path))
+    embed_cover_art(mp3_file_paths, image_data)
+
+
+# tag writes run one at a time off the GUI thread; main() waits for them.
+_cover_embed_executor = ThreadPoolExecutor(max_workers=1)
+
+
+def exec_cover_search(artist_name, album_name, on_result):
+    search_widget = cover_search_widget(artist_name, album_name)
+    search_widget.setWindowFlags(Qt.Tool) # Tool window is alywas on top.
+    search_widget.show()
+
+    loop = QEventLoop()
+    search_widget.canceled.connect(loop.quit)
+    search_widget.finished.connect(loop.quit)
+    search_widget.result.connect(on_result)
+    search_widget.search()
+    loop.exec()
+
+
 class name_widget(QWidget):
     def __init__(self, name, parent=None):
         super(name_widget, self).__init__(parent)
@@ -316,11 +1079,14 @@ class cover_search_widget(QWidget):
         }
     '''
 
-    def __init__(self, artist_name, album_name, parent=None):
+    def __init__(self, artist_name, album_name, parent=None, prefetch_depth=PREFETCH_DEPTH,
+                 show_stats=SHOW_SEARCH_STATS):
         super(cover_search_widget, self).__init__(parent)
 
         self._artist_name = artist_name
         self._album_name = album_name
+        self._prefetch_depth = prefetch_depth
+        self._show_stats = show_stats
 
         self.setWindowTitle('{}: {}'.format(artist_name, album_name))
         self.resize(SEARCH_WINDOW_WIDTH, SEARCH_WINDOW_HEIGHT)
@@ -328,8 +1094,12 @@ class cover_search_widget(QWidget):
 
         self._cover_start_index = 1
         self._selected_cover_index = -1
-        self._cover_pixmaps = []
-        self._cover_resolutions = []
+        self._cover_candidates = []
+        self._cover_thumbnails = []
+        self._search_worker = None
+        self._searching = False
+        self._exhausted = False
+        self._closed = False
 
         self._init_layout()
         self.setLayout(self._layout)
@@ -407,6 +1177,8 @@ class cover_search_widget(QWidget):
     def _init_button_layout(self):
         self._button_layout = QHBoxLayout()
         self._button_layout.setContentsMargins(0, 0, 30, 0)
+        if self._show_stats:
+            self._init_stats_label()
         self._button_layout.addStretch(1)
         ok_button = QPushButton('OK')
         ok_button.setStyleSheet(self._button_style)
@@ -418,6 +1190,38 @@ class cover_search_widget(QWidget):
         ok_button.clicked.connect(self._ok)
         cancel_button.clicked.connect(self._cancel)
 
+    def _init_stats_label(self):
+        # live search latencies; byte and image counts are since the window opened
+        self._stats_label = QLabel()
+        self._stats_label.setStyleSheet('color: {}'.format(COLOR))
+        self._stats_label.setContentsMargins(30, 0, 0, 0)
+        self._button_layout.addWidget(self._stats_label)
+
+        self._stats_base = get_metrics().snapshot()['counters']
+        self._stats_timer = QTimer(self)
+        self._stats_timer.setInterval(STATS_UPDATE_INTERVAL)
+        self._stats_timer.timeout.connect(self._update_stats)
+        self._stats_timer.start()
+        self._update_stats()
+
+    def _update_stats(self):
+        snapshot = get_metrics().snapshot()
+        timers = snapshot['timers']
+        counters = snapshot['counters']
+
+        def ms(name, key):
+            return timers[name][key] * 1000 if name in timers else 0
+
+        def since_open(name):
+            return counters.get(name, 0) - self._stats_base.get(name, 0)
+
+        self._stats_label.setText(
+            'page {:.0f} ms | download p50 {:.0f} / p95 {:.0f} ms | decode p50 {:.0f} ms | '
+            '{:.1f} MB, {} images'.format(
+                ms('search.page_fetch', 'p50'), ms('image.download', 'p50'),
+                ms('image.download', 'p95'), ms('image.decode', 'p50'),
+                since_open('image.bytes') / 1e6, len(self._cover_candidates)))
+
     def _set_state_loading(self):
         for cover_layout in self._cover_layouts:
             cover_layout.itemAt(0).widget().setPixmap(QPixmap())
@@ -425,26 +1229,81 @@ class cover_search_widget(QWidget):
         self._cover_layouts[center_index].itemAt(0).widget().setText('Loading...')
 
     def search(self):
-        pixmaps = download_cover_images(self._artist_name, self._album_name,
-                                        self._cover_start_index, N_QUERY)
-        for p in pixmaps:
-            resolution = p.size()
-            self._cover_pixmaps.append(p)
-            self._cover_resolutions.append(resolution)
+        if self._exhausted:
+            return
+        if self._search_worker is None:
+            self._search_worker = cover_search_worker(self._artist_name, self._album_name)
+            self._search_worker.candidate_found.connect(self._add_cover)
+            self._search_worker.candidate_replaced.connect(self._replace_cover)
+            self._search_worker.exhausted.connect(self._search_exhausted)
+            start_cover_search_worker(self._search_worker)
+
+        # the shown page plus prefetch_depth pages after it
+        page_end = self._cover_start_index - 1 + N_QUERY
+        self._searching = len(self._cover_candidates) < page_end
+        self._search_worker.request(page_end + self._prefetch_depth * N_QUERY)
+
+    @pyqtSlot(object)
+    def _add_cover(self, candidate):
+        if self._closed:
+            return
+
+        # only the compressed bytes and a thumbnail are kept per result
+        self._cover_candidates.append(candidate._replace(thumbnail=None))
+        self._cover_thumbnails.append(QPixmap.fromImage(candidate.thumbnail))
+
+        pixmap_index = len(self._cover_candidates) - 1
+        if pixmap_index >= self._cover_start_index - 1 + N_QUERY:
+            self._searching = False
+        if self._cover_start_index - 1 <= pixmap_index < self._cover_start_index - 1 + N_QUERY:
+            self._set_state_showing()
+            self._show_selected_cover()
+
+    @pyqtSlot(int, object)
+    def _replace_cover(self, index, candidate):
+        # a larger version of a cover already found
+        if self._closed:
+            return
 
+        self._cover_candidates[index] = candidate._replace(thumbnail=None)
+        self._cover_thumbnails[index] = QPixmap.fromImage(candidate.thumbnail)
+        if self._cover_start_index - 1 <= index < self._cover_start_index - 1 + N_QUERY:
+            self._set_state_showing()
+            self._show_selected_cover()
+
+    @pyqtSlot()
+    def _search_exhausted(self):
+        self._searching = False
+        self._exhausted = True
+        if self._closed:
+            return
         self._set_state_showing()
 
     def _set_state_showing(self):
+        n_shown = 0
         for i in range(len(self._cover_layouts)):
             pixmap_index = i + self._cover_start_index - 1
-            self._cover_layouts[i].itemAt(0).widget().setPixmap(self._cover_pixmaps[pixmap_index])
-            width = self._cover_resolutions[pixmap_index].width()
-            height = self._cover_resolutions[pixmap_index].height()
-            self._cover_layouts[i].itemAt(1).widget().setText('{}x{}'.format(width, height))
+            cover = self._cover_layouts[i].itemAt(0).widget()
+            resolution_label = self._cover_layouts[i].itemAt(1).widget()
+            if pixmap_index >= len(self._cover_candidates):
+                cover.setPixmap(QPixmap())
+                resolution_label.setText('')
+                continue
+
+            cover.setPixmap(self._cover_thumbnails[pixmap_index])
+            candidate = self._cover_candidates[pixmap_index]
+            resolution_label.setText('{}x{}'.format(candidate.width, candidate.height))
+            n_shown += 1
+
+        if n_shown == 0 and self._searching:
+            self._set_state_loading()
+        elif n_shown == 0 and self._exhausted:
+            center_index = N_QUERY // 2
+            self._cover_layouts[center_index].itemAt(0).widget().setText('No Results')
 
     def _show_selected_cover(self):
         for i, cover_layout in enumerate(self._cover_layouts):
-            if (self._cover_start_index + i) == self._selected_cover_index:
+            if (self._cover_start_index + i - 1) == self._selected_cover_index:
                 cover_layout.itemAt(0).widget().selected()
                 
     @pyqtSlot()
@@ -463,26 +1322,119 @@ class cover_search_widget(QWidget):
     @pyqtSlot()
     def _next(self):
         self._cover_start_index += N_QUERY
-        if self._cover_start_index > len(self._cover_pixmaps):
-            self._set_state_loading()
-            self.search()
-        else:
-            self._set_state_showing()
+        self.search()
+        self._set_state_showing()
         self._search_layout.itemAt(0).widget().setIcon(self._left_icon)
         self._show_selected_cover()
 
     @pyqtSlot()
     def _ok(self):
-        if self._selected_cover_index != -1:
-            self.result.emit(self._cover_pixmaps[self._selected_cover_index])
+        if 0 <= self._selected_cover_index < len(self._cover_candidates):
+            candidate = self._cover_candidates[self._selected_cover_index]
+            cover = QPixmap.fromImage(decode_cover_candidate(candidate))
+            if cover.isNull(): # did not decode at full size; another one can be chosen
+                print('decode error: {}'.format(candidate.url))
+                return
+            self._stop_search()
+            self.result.emit(cover)
             self.finished.emit()
             self.close()
 
     @pyqtSlot()
     def _cancel(self):
+        self._stop_search()
         self.canceled.emit()
         self.close()
 
+    def closeEvent(self, event):
+        # closing the window is a cancel unless OK/Cancel already handled it.
+        if not self._closed:
+            self._stop_search()
+            self.canceled.emit()
+        super(cover_search_widget, self).closeEvent(event)
+
+    def _stop_search(self):
+        self._closed = True
+        if self._show_stats:
+            self._stats_timer.stop()
+        if self._search_worker is not None:
+            self._search_worker.cancel()
+
+
+class cover_search_worker(QThread):
+    # Harvests search results on its own thread. request(n) asks for the
+    # first n results in total; they are emitted one by one as cover
+    # candidates and the harvest pauses once n have been emitted.
+    # Duplicates are collapsed and results ranked on the way (see
+    # iter_unique_cover_images); a larger duplicate of an emitted result
+    # is emitted as candidate_replaced.
+    candidate_found = pyqtSignal(object)
+    candidate_replaced = pyqtSignal(int, object)
+    exhausted = pyqtSignal()
+
+    def __init__(self, artist_name, album_name, parent=None):
+        super(cover_search_worker, self).__init__(parent)
+
+        self._cancel_event = threading.Event()
+        self._harvest = harvest_cover_images(artist_name, album_name,
+                                             cancel_event=self._cancel_event,
+                                             thumbnail_size=COVER_SIZE)
+        self._candidates = iter_unique_cover_images(self._harvest, RANK_WINDOW)
+        self._condition = threading.Condition()
+        self._n_requested = 0
+        self._n_found = 0
+
+    def request(self, n_images):
+        with self._condition:
+            self._n_requested = max(self._n_requested, n_images)
+            self._condition.notify()
+
+    def cancel(self):
+        self._cancel_event.set()
+        with self._condition:
+            self._condition.notify()
+
+    def run(self):
+        try:
+            while True:
+                with self._condition:
+                    while not self._cancel_event.is_set() and self._n_found >= self._n_requested:
+                        self._condition.wait()
+                    if self._cancel_event.is_set():
+                        return
+
+                try:
+                    slot, candidate = next(self._candidates, (None, None))
+                except Exception as e:
+                    print('cover search error: {}'.format(e))
+                    candidate = None
+
+                if candidate is None:
+                    if not self._cancel_event.is_set():
+                        self.exhausted.emit()
+                    return
+
+                if slot < self._n_found:
+                    self.candidate_replaced.emit(slot, candidate)
+                    continue
+                with self._condition:
+                    self._n_found += 1
+                self.candidate_found.emit(candidate)
+        finally:
+            self._candidates.close()
+            self._harvest.close()
+
+
+# Workers are kept referenced until their thread ends; a dialog that is
+# closed mid-download does not wait for it.
+_running_search_workers = set()
+
+
+def start_cover_search_worker(worker):
+    _running_search_workers.add(worker)
+    worker.finished.connect(lambda: _running_search_workers.discard(worker))
+    worker.start()
+
 
 class searched_cover_widget(QWidget):
     clicked = pyqtSignal()
@@ -515,7 +1467,7 @@ class searched_cover_widget(QWidget):
         self._label.setText(text)
 
     def setPixmap(self, pixmap):
-        if not pixmap.isNull():
+        if pixmap.width() > COVER_SIZE or pixmap.height() > COVER_SIZE:
             p = pixmap.scaled(QSize(COVER_SIZE, COVER_SIZE), Qt.KeepAspectRatio)
             self._label.setPixmap(p)
         else:
@@ -541,7 +1493,15 @@ def main():
     app = QApplication(sys.argv)
     w = main_widget()
     w.show()
-    sys.exit(app.exec_())
+    ret = app.exec_()
+    for worker in list(_running_search_workers):
+        worker.cancel()
+        worker.wait()
+    _cover_embed_executor.shutdown(wait=True)
+    if SHOW_SEARCH_STATS:
+        print(get_metrics().summary())
+    get_metrics().close()
+    sys.exit(ret)
 
 
 if __name__ == '__main__':    
@@ -1,53 +1,494 @@
 import os
+import re
 import sys
 import time
-from collections import defaultdict
+import html
+from bisect import bisect_left
+from collections import defaultdict, namedtuple
 
 import threading
-from queue import Queue
-
-import requests
-from bs4 import BeautifulSoup
+import multiprocessing
+import numpy as np
+from urllib.parse import urlencode, urlsplit
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
 
 from mutagen.easyid3 import EasyID3
+from mutagen.id3 import ID3, APIC, ID3NoHeaderError
 
-from PyQt5.QtGui import QPixmap
-from PyQt5.QtCore import QByteArray
+from PyQt5.QtGui import QImage
+from PyQt5.QtCore import Qt, QSize
 
+from http_session import get_http_session
+from search_cache import search_cache
+from image_header import parse_image_header, NEED_MORE_DATA
+from image_hash import phash_images, hamming_distances
+from instrumentation import get_metrics
 
-N_THREADS = 4
 
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.album-cover-search')
+SEARCH_CACHE_PATH = os.path.join(CACHE_DIR, 'search_cache.sqlite')
 
-def get_mp3_file_paths(paths):
+N_DOWNLOAD_THREADS = int(os.environ.get('ALBUM_COVER_SEARCH_DOWNLOAD_THREADS', 16))
+SEARCH_URL = os.environ.get('ALBUM_COVER_SEARCH_URL', 'http://image.search.yahoo.co.jp/search')
+MAX_SEARCH_PAGES = 10 # result pages requested per harvest at most
+MAX_URLS_PER_PAGE = 200
+CANCEL_POLL_INTERVAL = 0.1 # seconds between cancellation checks while downloads run
+DOWNLOAD_MARGIN = 2 # downloads in flight beyond the images still needed, for the ones that fail
+DUPLICATE_HASH_DISTANCE = 10 # perceptual hashes this close are the same cover
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+COVER_SIZE = 150 # covers in the album grid and search thumbnails fit in this square
+N_SCAN_THREADS = 8
+MP3_EXTENSIONS = ('.mp3',)
+N_TAG_PROCESSES = os.cpu_count() or 1
+MIN_TAG_BATCH_SIZE = 64 # smaller batches are read in-process
+
+
+def is_mp3_file_path(path):
+    _, ext = os.path.splitext(path)
+    return ext.lower() in MP3_EXTENSIONS
+
+
+def scan_dir(dir_path):
+    with get_metrics().timer('scan.dir'):
+        return _scan_dir(dir_path)
+
+
+def _scan_dir(dir_path):
     file_paths = []
+    sub_dir_paths = []
+    try:
+        with os.scandir(dir_path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir():
+                        sub_dir_paths.append(entry.path)
+                    elif is_mp3_file_path(entry.name):
+                        file_paths.append(entry.path)
+                except OSError:
+                    continue
+    except OSError:
+        pass
+    return file_paths, sub_dir_paths
+
+
+def iter_mp3_file_paths(paths, n_threads=N_SCAN_THREADS, scanned_dir_paths=None):
+    # directories are scanned in parallel and files are yielded as soon as
+    # their directory has been listed, so the order is not deterministic.
+    # Every directory scanned is appended to scanned_dir_paths if given.
+    dir_paths = []
     for p in paths:
-        if not os.path.isdir(p):
-            _, ext = os.path.splitext(p)
-            if ext == '.mp3':
-                file_paths.append(p)
-            continue
+        if os.path.isdir(p):
+            dir_paths.append(p)
+        elif is_mp3_file_path(p):
+            yield p
+    if len(dir_paths) == 0:
+        return
+    if scanned_dir_paths is not None:
+        scanned_dir_paths.extend(dir_paths)
 
-        in_dir_paths = [os.path.join(p, name) for name in os.listdir(p)]
-        file_paths.extend(get_mp3_file_paths(in_dir_paths))
+    executor = ThreadPoolExecutor(max_workers=n_threads)
+    try:
+        pending = {executor.submit(scan_dir, p) for p in dir_paths}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                file_paths, sub_dir_paths = future.result()
+                for p in sub_dir_paths:
+                    pending.add(executor.submit(scan_dir, p))
+                if scanned_dir_paths is not None:
+                    scanned_dir_paths.extend(sub_dir_paths)
+                yield from file_paths
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
 
-    return file_paths
 
+def iter_chunks(iterable, chunk_size):
+    chunk = []
+    for x in iterable:
+        chunk.append(x)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if len(chunk) != 0:
+        yield chunk
 
-def get_artist_album_dict(mp3_file_paths):
-    artist_album_dict = defaultdict(set)
+
+def get_mp3_file_paths(paths):
+    return list(iter_mp3_file_paths(paths))
+
+
+tag_error = namedtuple('tag_error', ['path', 'reason'])
+
+
+class tag_read_error(Exception):
+    pass
+
+
+class _unsupported_id3v2(Exception):
+    pass
+
+
+_ID3V2_TEXT_FRAMES = {
+    2: {b'TP1': 'artist', b'TAL': 'album'},
+    3: {b'TPE1': 'artist', b'TALB': 'album'},
+    4: {b'TPE1': 'artist', b'TALB': 'album'},
+}
+_ID3V2_TEXT_ENCODINGS = ['latin-1', 'utf-16', 'utf-16-be', 'utf-8']
+_ID3V2_PICTURE_FRAMES = {2: b'PIC', 3: b'APIC', 4: b'APIC'}
+
+
+def _syncsafe_int(data):
+    return (data[0] << 21) | (data[1] << 14) | (data[2] << 7) | data[3]
+
+
+def _decode_id3v2_text(data):
+    if len(data) == 0:
+        return ''
+    if data[0] >= len(_ID3V2_TEXT_ENCODINGS):
+        raise _unsupported_id3v2('unknown text encoding')
+
+    body = data[1:]
+    if data[0] in (1, 2):
+        body = body[:len(body) - len(body) % 2]
+    text = body.decode(_ID3V2_TEXT_ENCODINGS[data[0]], errors='replace')
+    # multiple values are null separated, EasyID3 would return the first one.
+    return text.split('\x00')[0]
+
+
+def _read_id3v2_frames(file_path, frame_ids):
+    # Reads only the ID3v2 tag region at the head of the file and returns
+    # the version, the raw bodies of the requested frames (a list per id,
+    # in file order) and the ids of all frames present. Anything this minimal parser does not understand
+    # raises _unsupported_id3v2.
+    with open(file_path, 'rb') as f:
+        header = f.read(10)
+        if len(header) < 10 or header[:3] != b'ID3':
+            raise _unsupported_id3v2('no ID3v2 header')
+        major_version = header[3]
+        flags = header[5]
+        data = f.read(_syncsafe_int(header[6:10]))
+
+    if major_version not in _ID3V2_TEXT_FRAMES:
+        raise _unsupported_id3v2('ID3v2.{}'.format(major_version))
+    try:
+        return major_version, *_parse_id3v2_frames(major_version, flags, data, frame_ids)
+    except (IndexError, ValueError) as e:
+        # a malformed tag, mutagen can have a go at it
+        raise _unsupported_id3v2('{}: {}'.format(type(e).__name__, e))
+
+
+def _parse_id3v2_frames(major_version, flags, data, frame_ids):
+    if flags & 0x80:
+        if major_version == 4:
+            raise _unsupported_id3v2('unsynchronised ID3v2.4 tag')
+        data = data.replace(b'\xff\x00', b'\xff')
+
+    pos = 0
+    if flags & 0x40:
+        if len(data) < 4:
+            raise _unsupported_id3v2('short extended header')
+        if major_version == 2:
+            raise _unsupported_id3v2('compressed ID3v2.2 tag')
+        elif major_version == 3:
+            pos = 4 + int.from_bytes(data[0:4], 'big')
+        else:
+            pos = _syncsafe_int(data[0:4])
+
+    id_length, header_length = (3, 6) if major_version == 2 else (4, 10)
+    frames = {}
+    present_ids = set()
+    while pos + header_length <= len(data):
+        frame_id = data[pos:(pos + id_length)]
+        if frame_id[0] == 0: # padding
+            break
+        present_ids.add(frame_id)
+
+        if major_version == 2:
+            frame_size = int.from_bytes(data[(pos + 3):(pos + 6)], 'big')
+            unsupported_flags = 0
+        elif major_version == 3:
+            frame_size = int.from_bytes(data[(pos + 4):(pos + 8)], 'big')
+            unsupported_flags = data[pos + 9] & 0xC0 # compression, encryption
+        else:
+            frame_size = _syncsafe_int(data[(pos + 4):(pos + 8)])
+            unsupported_flags = data[pos + 9] & 0x0F # compression, encryption, unsync, length
+
+        if frame_id in frame_ids:
+            if unsupported_flags:
+                raise _unsupported_id3v2('flags 0x{:02x} on {}'.format(unsupported_flags, frame_id))
+            frames.setdefault(frame_id, []).append(
+                data[(pos + header_length):(pos + header_length + frame_size)])
+        pos += header_length + frame_size
+
+    return frames, present_ids
+
+
+def _read_mp3_tags_with_mutagen(file_path):
+    try:
+        tag = EasyID3(file_path)
+    except ID3NoHeaderError:
+        raise tag_read_error('no ID3 tag')
+    except Exception as e:
+        raise tag_read_error('{}: {}'.format(type(e).__name__, e))
+
+    tags = []
+    for key in ('artist', 'album'):
+        if key not in tag or len(tag[key]) == 0:
+            raise tag_read_error('missing {} tag'.format(key))
+        tags.append(tag[key][0])
+    # EasyID3 hides pictures; the text tags are there, so this parses.
+    has_art = len(ID3(file_path).getall('APIC')) != 0
+    return tags[0], tags[1], has_art
+
+
+def read_mp3_tag_info(file_path):
+    # returns (artist, album, has embedded art) or raises tag_read_error
+    try:
+        major_version, frames, present_ids = _read_id3v2_frames(
+            file_path, set(_ID3V2_TEXT_FRAMES[2]) | set(_ID3V2_TEXT_FRAMES[3]))
+        names = {}
+        for frame_id, key in _ID3V2_TEXT_FRAMES[major_version].items():
+            if frame_id in frames:
+                names[key] = _decode_id3v2_text(frames[frame_id][0])
+        if 'artist' in names and 'album' in names:
+            has_art = _ID3V2_PICTURE_FRAMES[major_version] in present_ids
+            return names['artist'], names['album'], has_art
+    except _unsupported_id3v2:
+        pass
+    except OSError as e:
+        raise tag_read_error('{}: {}'.format(type(e).__name__, e))
+
+    # ID3v1, tags appended at the end of the file and exotic ID3v2 features
+    # are left to mutagen.
+    return _read_mp3_tags_with_mutagen(file_path)
+
+
+def read_mp3_tags(file_path):
+    # returns (artist, album) or raises tag_read_error
+    return read_mp3_tag_info(file_path)[:2]
+
+
+def _split_picture_frame(major_version, body):
+    # Returns (picture type, image data).
+    # APIC: encoding, mime type, picture type, description, data
+    # PIC (v2.2): encoding, 3 byte format, picture type, description, data
+    if len(body) < 2:
+        raise _unsupported_id3v2('short picture frame')
+    encoding = body[0]
+    if major_version == 2:
+        pos = 3
+    else:
+        pos = body.find(b'\x00', 1)
+        if pos < 0:
+            raise _unsupported_id3v2('bad picture mime type')
+    pos += 2 # terminator or format end, picture type
+    if pos > len(body):
+        raise _unsupported_id3v2('short picture frame')
+    picture_type = body[pos - 1]
+
+    if encoding in (1, 2):
+        end = pos
+        while True:
+            end = body.find(b'\x00\x00', end)
+            if end < 0 or (end - pos) % 2 == 0:
+                break
+            end += 1
+        terminator_length = 2
+    else:
+        end = body.find(b'\x00', pos)
+        terminator_length = 1
+    if end < 0:
+        raise _unsupported_id3v2('bad picture description')
+    return picture_type, body[(end + terminator_length):]
+
+
+def read_embedded_art(file_path):
+    # Returns the image data of the front cover (picture type 3), else of
+    # the first embedded picture, or None.
+    try:
+        major_version, frames, _ = _read_id3v2_frames(
+            file_path, set(_ID3V2_PICTURE_FRAMES.values()))
+        frame_id = _ID3V2_PICTURE_FRAMES[major_version]
+        if frame_id not in frames:
+            return None
+        pictures = [_split_picture_frame(major_version, body) for body in frames[frame_id]]
+        front_covers = [data for picture_type, data in pictures if picture_type == 3]
+        return (front_covers or [data for _, data in pictures])[0]
+    except _unsupported_id3v2:
+        pass
+    except OSError:
+        return None
+
+    try:
+        pictures = ID3(file_path).getall('APIC')
+    except Exception:
+        return None
+    if len(pictures) == 0:
+        return None
+    front_covers = [p for p in pictures if p.type == 3]
+    return (front_covers or pictures)[0].data
+
+
+def embed_cover_art(mp3_file_paths, image_data, mime='image/jpeg'):
+    # Replaces the embedded pictures of each file with image_data as the
+    # front cover. Returns the number of files written. ID3v2.3 tags stay
+    # v2.3 (mutagen writes v2.4 otherwise, which some players cannot read);
+    # v2.2 tags, which mutagen cannot write, become v2.3.
+    n_written = 0
     for p in mp3_file_paths:
         try:
-            tag = EasyID3(p)
-        except:
-            print('mp3 load error: {}'.format(p))
-            continue
-        artist_name = tag['artist'][0]
-        album_name = tag['album'][0]
+            try:
+                tag = ID3(p)
+            except ID3NoHeaderError:
+                tag = ID3()
+            tag.delall('APIC')
+            v2_version = 4 if tag.version >= (2, 4, 0) else 3
+            if v2_version == 3:
+                tag.update_to_v23()
+            # v2.3 has no UTF-8 text encoding
+            tag.add(APIC(encoding=3 if v2_version == 4 else 1, mime=mime, type=3, desc='Cover',
+                         data=image_data))
+            tag.save(p, v2_version=v2_version)
+            n_written += 1
+        except Exception as e:
+            print('cover embed error: {}: {}'.format(p, e))
+    return n_written
+
+
+def _read_mp3_tags_or_error(file_path):
+    try:
+        return file_path, read_mp3_tag_info(file_path), None
+    except tag_read_error as e:
+        return file_path, None, str(e)
+    except Exception as e:
+        # one bad file must not take the batch (and the pool) down
+        return file_path, None, '{}: {}'.format(type(e).__name__, e)
+
+
+_tag_process_pool = None
+
+
+def _get_tag_process_pool():
+    global _tag_process_pool
+    if _tag_process_pool is None:
+        # spawn instead of fork: the GUI process runs Qt and scanner threads.
+        _tag_process_pool = ProcessPoolExecutor(
+            max_workers=N_TAG_PROCESSES, mp_context=multiprocessing.get_context('spawn'))
+    return _tag_process_pool
+
+
+def read_mp3_tags_batch(mp3_file_paths):
+    # returns ({path: (artist, album, has embedded art)}, [tag_error, ...])
+    mp3_file_paths = list(mp3_file_paths)
+    metrics = get_metrics()
+    with metrics.timer('tags.read_batch', n_files=len(mp3_file_paths)):
+        if N_TAG_PROCESSES > 1 and len(mp3_file_paths) >= MIN_TAG_BATCH_SIZE:
+            chunksize = max(1, len(mp3_file_paths) // (N_TAG_PROCESSES * 4))
+            results = _get_tag_process_pool().map(_read_mp3_tags_or_error, mp3_file_paths,
+                                                   chunksize=chunksize)
+        else:
+            results = map(_read_mp3_tags_or_error, mp3_file_paths)
+
+        tags = {}
+        errors = []
+        for p, t, reason in results:
+            if t is None:
+                errors.append(tag_error(p, reason))
+            else:
+                tags[p] = t
+    metrics.count('tags.files', len(mp3_file_paths))
+    if len(errors) != 0:
+        metrics.count('tags.errors', len(errors))
+    return tags, errors
+
+
+def get_artist_album_dict(mp3_file_paths, errors=None, art_paths=None):
+    # art_paths, if given, receives {album dir: an mp3 with embedded art}
+    artist_album_dict = defaultdict(set)
+    tags, tag_errors = read_mp3_tags_batch(mp3_file_paths)
+    for p, (artist_name, album_name, has_art) in tags.items():
         dirname = os.path.dirname(p)
         artist_album_dict[artist_name].add((album_name, dirname))
+        if has_art and art_paths is not None:
+            art_paths.setdefault(dirname, p)
+    if errors is not None:
+        errors.extend(tag_errors)
     return artist_album_dict
 
 
+def merge_artist_album_dict(dst, src):
+    # returns the (artist, album, dir) tuples that were not in dst yet
+    new_albums = []
+    for artist_name, albums in src.items():
+        dst_albums = dst[artist_name]
+        for album in albums:
+            if album not in dst_albums:
+                dst_albums.add(album)
+                new_albums.append((artist_name, *album))
+    return new_albums
+
+
+def album_sort_key(album):
+    artist_name, album_name, dirname = album
+    return artist_name.lower(), album_name.lower(), dirname
+
+
+def get_sorted_albums(artist_album_dict):
+    albums = [(artist_name, album_name, dirname)
+              for artist_name, album_set in artist_album_dict.items()
+              for album_name, dirname in album_set]
+    albums.sort(key=album_sort_key)
+    return albums
+
+
+def iter_album_insertions(keys, new_albums):
+    # Groups new_albums by where they belong in a list sorted by
+    # album_sort_key, given that list's keys. Yields (position, albums,
+    # keys) from the end of the list backwards, so each group can be
+    # inserted as it is yielded without moving the positions of the rest.
+    new_albums = sorted(new_albums, key=album_sort_key)
+    new_keys = [album_sort_key(album) for album in new_albums]
+    groups = []
+    for i, key in enumerate(new_keys):
+        position = bisect_left(keys, key)
+        if len(groups) != 0 and groups[-1][0] == position:
+            groups[-1][2] = i + 1
+        else:
+            groups.append([position, i, i + 1])
+    for position, start, end in reversed(groups):
+        yield position, new_albums[start:end], new_keys[start:end]
+
+
+def find_album(keys, album, get_album):
+    # Position of album in a list sorted by album_sort_key, given that
+    # list's keys and get_album(position), or None. Albums whose names only
+    # differ in case have equal keys, so the first equal key is not
+    # necessarily the album.
+    key = album_sort_key(album)
+    position = bisect_left(keys, key)
+    while position < len(keys) and keys[position] == key:
+        if get_album(position) == album:
+            return position
+        position += 1
+    return None
+
+
+def iter_false_ranges(values):
+    # (start, end) of each run of false values, list.index doing the scanning
+    start = 0
+    while True:
+        try:
+            start = values.index(False, start)
+        except ValueError:
+            return
+        try:
+            end = values.index(True, start)
+        except ValueError:
+            end = len(values)
+        yield start, end
+        start = end
+
+
 def get_n_albums(artist_album_dict):
     n_albums = 0
     for val in artist_album_dict.values():
@@ -55,82 +496,357 @@ def get_n_albums(artist_album_dict):
     return n_albums
        
     
-def download_cover_images(artist_name, album_name, start_index, n_query):
-    t0 = time.time()
-    
+def download_cover_images(artist_name, album_name, start_index, n_query,
+                          cancel_event=None, on_image=None, cache_images=True):
+    # Returns up to n_query cover_candidates; on_image is called for every
+    # candidate as soon as it has been downloaded.
+    candidates = []
+    with get_metrics().timer('search.download_cover_images'):
+        for candidate in harvest_cover_images(artist_name, album_name, start_index=start_index,
+                                              max_images=n_query, cancel_event=cancel_event,
+                                              cache_images=cache_images):
+            candidates.append(candidate)
+            if on_image is not None:
+                on_image(candidate)
+    return candidates
+
+
+def harvest_cover_images(artist_name, album_name, start_index=1, max_images=None,
+                         max_pages=MAX_SEARCH_PAGES, time_budget=None, cancel_event=None,
+                         thumbnail_size=COVER_SIZE, cache_images=True):
+    # Yields cover_candidates one by one while lazily walking the result
+    # pages. URLs are deduplicated across pages, and the harvest stops after
+    # max_images images, max_pages page requests, time_budget seconds, a
+    # page without new URLs or cancellation. Nothing is fetched while the
+    # consumer is not asking for the next image, apart from the downloads
+    # already in flight; with max_images, those are only the images still
+    # needed plus DOWNLOAD_MARGIN. Downloaded bytes go into the search
+    # cache unless cache_images is false.
+    deadline = time.time() + time_budget if time_budget is not None else None
     query = '{}+{}'.format(artist_name, album_name)
-    query_params = {'p': query, 'b': start_index, 'dim': 'medium'}
-    search_url = 'http://image.search.yahoo.co.jp/search'
-    response = requests.get(search_url, params=query_params)
-    data = response.text
-
-    soup = BeautifulSoup(data, 'lxml')
-    a_tags = soup.find_all('a')
-    IMAGE_EXTENTIONS = ['.jpg', '.jpeg', '.png']
+    seen_urls = set()
+    n_images = 0
+
+    for _ in range(max_pages):
+        if is_canceled(cancel_event) or (deadline is not None and time.time() > deadline):
+            return
+
+        query_params = {'p': query, 'b': start_index, 'dim': 'medium'}
+        image_urls = search_image_urls(query_params)
+        new_urls = []
+        for url in image_urls:
+            if url not in seen_urls:
+                seen_urls.add(url)
+                new_urls.append(url)
+        if len(new_urls) == 0:
+            return
+        start_index += len(image_urls)
+
+        max_page_images = None if max_images is None else max_images - n_images
+        for candidate in iter_downloaded_images(new_urls, cancel_event, thumbnail_size,
+                                                max_images=max_page_images,
+                                                cache_images=cache_images):
+            yield candidate
+            n_images += 1
+            if max_images is not None and n_images >= max_images:
+                return
+            if deadline is not None and time.time() > deadline:
+                return
+
+
+def iter_unique_cover_images(candidates, window, max_distance=DUPLICATE_HASH_DISTANCE):
+    # Collapses perceptual duplicates in a stream of cover_candidates and
+    # reorders it by cover_candidate_score. Yields (slot, candidate): the
+    # best of the next `window` unique candidates goes to a new slot, and
+    # a later duplicate with more pixels than an already yielded candidate
+    # is yielded again with that candidate's slot to replace it.
+    slot_candidates = []
+    slot_hashes = np.empty(0, np.uint64)
+    pool = []
+    pool_hashes = np.empty(0, np.uint64)
+
+    def pixels(candidate):
+        return candidate.width * candidate.height
+
+    for candidate in candidates:
+        # candidates arrive one at a time, so each is hashed on its own
+        hash_value = phash_images([candidate.thumbnail])[0]
+
+        distances = hamming_distances(hash_value, slot_hashes)
+        if len(distances) != 0 and distances.min() <= max_distance:
+            slot = int(distances.argmin())
+            if pixels(candidate) > pixels(slot_candidates[slot]):
+                slot_candidates[slot] = candidate
+                yield slot, candidate
+            continue
+
+        distances = hamming_distances(hash_value, pool_hashes)
+        if len(distances) != 0 and distances.min() <= max_distance:
+            i = int(distances.argmin())
+            if pixels(candidate) > pixels(pool[i]):
+                pool[i] = candidate
+            continue
+
+        pool.append(candidate)
+        pool_hashes = np.append(pool_hashes, hash_value)
+        if len(pool) >= window:
+            i = max(range(len(pool)), key=lambda j: cover_candidate_score(pool[j]))
+            slot_candidates.append(pool.pop(i))
+            slot_hashes = np.append(slot_hashes, pool_hashes[i])
+            pool_hashes = np.delete(pool_hashes, i)
+            yield len(slot_candidates) - 1, slot_candidates[-1]
+
+    for i in sorted(range(len(pool)), key=lambda j: cover_candidate_score(pool[j]), reverse=True):
+        slot_candidates.append(pool[i])
+        yield len(slot_candidates) - 1, pool[i]
+
+
+def search_image_urls(query_params):
+    metrics = get_metrics()
+    cache_key = urlencode(sorted(query_params.items()))
+    image_urls = get_search_cache().get_page(cache_key)
+    if image_urls is not None:
+        metrics.count('search.page_cache_hits')
+        return image_urls
+
+    with metrics.timer('search.page_fetch'):
+        data = get_http_session().get_text(SEARCH_URL, params=query_params)
+    metrics.count('search.page_bytes', len(data))
+    with metrics.timer('search.html_parse'):
+        image_urls = extract_image_urls(data, MAX_URLS_PER_PAGE)
+
+    # An empty page is not cached: it may as well be a transient failure
+    # as a search without results, and would hide results for the TTL.
+    if len(image_urls) != 0:
+        get_search_cache().put_page(cache_key, image_urls)
+    return image_urls
+
+
+_A_HREF_PATTERN = re.compile(
+    r'''<a\s(?:[^>]*?\s)?href\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+))''', re.IGNORECASE)
+
+
+def extract_image_urls(data, limit=None):
+    # Single regex pass over the raw HTML for <a href> values that look like
+    # image links, instead of building a full DOM. Stops after limit URLs.
     image_urls = []
-    for a_tag in a_tags:
-        link_url = a_tag.get('href')
-        for ext in IMAGE_EXTENTIONS:
-            if ext in link_url:
-                image_urls.append(link_url)
-    
-    pixmaps = []
-    for i in range(0, len(image_urls), n_query):        
-        tmp_pixmaps = generate_pixmap(image_urls[i:(i + n_query)])
-        for tmp in tmp_pixmaps:
-            if tmp is not None:
-                pixmaps.append(tmp)
-        if len(pixmaps) >= n_query:
-            print('elapsed: {}'.format(time.time() - t0))
-            return pixmaps[:n_query]
+    for match in _A_HREF_PATTERN.finditer(data):
+        link_url = html.unescape(match.group(1) or match.group(2) or match.group(3) or '')
+        lower_url = link_url.lower()
+        if any(ext in lower_url for ext in IMAGE_EXTENSIONS):
+            image_urls.append(link_url)
+            if limit is not None and len(image_urls) >= limit:
+                break
+    return image_urls
+
+
+_search_cache = None
+_search_cache_lock = threading.Lock()
+
+
+def get_search_cache():
+    global _search_cache
+    with _search_cache_lock:
+        if _search_cache is None:
+            _search_cache = search_cache(SEARCH_CACHE_PATH)
+        return _search_cache
+
+
+def is_canceled(cancel_event):
+    return cancel_event is not None and cancel_event.is_set()
+
+
+DOWNLOAD_CHUNK_SIZE = 16 * 1024
+MAX_IMAGE_BYTES = 8 * 1024 * 1024
+MIN_IMAGE_SIZE = 100 # px, shorter side
+IMAGE_CONTENT_TYPES = ('application/octet-stream', 'binary/octet-stream', '')
+
+
+_download_executor = None
+_download_executor_lock = threading.Lock()
+
+
+def get_download_executor():
+    # One pool for the whole session; search workers stream URLs into it
+    # instead of starting threads per batch.
+    global _download_executor
+    with _download_executor_lock:
+        if _download_executor is None:
+            _download_executor = ThreadPoolExecutor(max_workers=N_DOWNLOAD_THREADS,
+                                                    thread_name_prefix='cover-download')
+        return _download_executor
+
+
+def set_download_threads(n_threads):
+    global N_DOWNLOAD_THREADS, _download_executor
+    with _download_executor_lock:
+        N_DOWNLOAD_THREADS = n_threads
+        if _download_executor is not None:
+            # queued and running downloads still finish on the old pool
+            _download_executor.shutdown(wait=False)
+            _download_executor = None
+
+
+# A downloaded search result: the compressed bytes, the size read from the
+# image header and a thumbnail decoded at display size. QImage rather than
+# QPixmap because it is created on download threads.
+cover_candidate = namedtuple('cover_candidate',
+                             ['url', 'data', 'format', 'width', 'height', 'thumbnail'])
+
+
+def cover_candidate_score(candidate):
+    # prefers large, square images; sizes beyond 1000px earn nothing more
+    short_side = min(candidate.width, candidate.height)
+    long_side = max(candidate.width, candidate.height)
+    squareness = short_side / long_side if long_side > 0 else 0
+    return min(short_side, 1000) * squareness ** 2
+
+
+def decode_cover_candidate(candidate, size=None):
+    # Full resolution unless size (a QSize to fit into) is given; a null
+    # image if the data does not decode. QImageReader on a QBuffer created
+    # here would call back into Python while holding Qt's image plugin lock
+    # and can deadlock against a reader on another thread (the cover
+    # loader's), so the data is handed to Qt as a whole.
+    image = QImage.fromData(candidate.data, candidate.format)
+    if size is not None and not image.isNull():
+        image = image.scaled(size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+    return image
+
+
+def download_image(url, cancel_event=None, thumbnail_size=COVER_SIZE, cache_image=True):
+    if is_canceled(cancel_event):
+        return None
+
+    metrics = get_metrics()
+    data = get_search_cache().get_image(url)
+    cached = data is not None
+    if cached:
+        metrics.count('image.cache_hits')
     else:
-        pixmaps += download_cover_images(artist_name, album_name,
-                                         start_index + len(pixmaps),
-                                         n_query - len(pixmaps))
-        return pixmaps[:n_query]
-    
-    
-def generate_pixmap_parallel(data_queue, results_list):
-    while not data_queue.empty():
-        url, index = data_queue.get()
         try:
-            response = requests.get(url, stream=True)
-        except:
-            results_list[index] = None
-            data_queue.task_done()
-            continue
-            
-        byte_data = QByteArray(response.raw.read())
-        response.close()
-    
-        _, ext = os.path.splitext(url.split('/')[-1])
-        pixmap = QPixmap()
+            data = fetch_image_bytes(url, cancel_event)
+        except Exception as e:
+            print('download error: {}: {}'.format(url, e))
+            return None
+        if data is None:
+            return None
+
+    header = parse_image_header(data)
+    if header is None or header == NEED_MORE_DATA:
+        return None
+    candidate = cover_candidate(url, data, *header, None)
+    with metrics.timer('image.decode', host=urlsplit(url).netloc):
+        thumbnail = decode_cover_candidate(candidate, QSize(thumbnail_size, thumbnail_size))
+    if thumbnail.isNull():
+        return None
+    if not cached and cache_image and not is_canceled(cancel_event):
+        get_search_cache().put_image(url, data)
+    return candidate._replace(thumbnail=thumbnail)
+
+
+def fetch_image_bytes(url, cancel_event=None):
+    # Downloads an image body, giving up as early as possible: on a
+    # non-image Content-Type, a Content-Length above MAX_IMAGE_BYTES, an
+    # unknown format or an image smaller than MIN_IMAGE_SIZE (both read
+    # from the first bytes), or once the body grows past MAX_IMAGE_BYTES.
+    metrics = get_metrics()
+    data = bytearray()
+    with metrics.timer('image.download', host=urlsplit(url).netloc):
         try:
-            pixmap.loadFromData(byte_data, ext[1:])
-        except:
-            results_list[index] = None
-            data_queue.task_done()
-            continue
-    
-        results_list[index] = pixmap        
-        data_queue.task_done()
-        
-        
-def generate_pixmap(urls):
-    results = [0 for i in range(len(urls))]
-    data_queue = Queue()
-    for i in range(len(results)):
-        data_queue.put((urls[i], i))
-    
-    workers = []    
-    for i in range(N_THREADS):
-        worker = threading.Thread(target=generate_pixmap_parallel, args=(data_queue, results))
-        worker.setDaemon(True)
-        worker.start()
-        workers.append(worker)
-     
-    data_queue.join()
-    for w in workers:
-        w.join()
-        
-    return results
\ No newline at end of file
+            return _read_image_body(url, cancel_event, data)
+        finally:
+            metrics.count('image.bytes', len(data))
+
+
+def _read_image_body(url, cancel_event, data):
+    # data receives the body as it arrives
+    with get_http_session().get(url, stream=True) as response:
+        if response.status_code != 200:
+            return None
+        content_type = response.headers.get('Content-Type', '').split(';')[0].strip().lower()
+        if not content_type.startswith('image/') and content_type not in IMAGE_CONTENT_TYPES:
+            return None
+        content_length = response.headers.get('Content-Length')
+        if content_length is not None and content_length.isdigit() \
+                and int(content_length) > MAX_IMAGE_BYTES:
+            return None
+
+        header = None
+        for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+            if is_canceled(cancel_event):
+                return None
+            data += chunk
+            if len(data) > MAX_IMAGE_BYTES:
+                return None
+            if header is None or header == NEED_MORE_DATA:
+                # read on until the size is known, however long the
+                # metadata before it; MAX_IMAGE_BYTES still applies
+                header = parse_image_header(data)
+                if header is None:
+                    return None
+                if header != NEED_MORE_DATA:
+                    _, width, height = header
+                    if min(width, height) < MIN_IMAGE_SIZE:
+                        return None
+
+        if header is None or header == NEED_MORE_DATA:
+            return None
+        return bytes(data)
+
+
+class _any_event(object):
+    # is set once one of the events is, for passing as a cancel_event
+    def __init__(self, *events):
+        self._events = [e for e in events if e is not None]
+
+    def is_set(self):
+        return any(e.is_set() for e in self._events)
+
+
+def iter_downloaded_images(urls, cancel_event=None, thumbnail_size=COVER_SIZE, window=None,
+                           max_images=None, cache_images=True):
+    # Yields cover_candidates in completion order, keeping at most window
+    # downloads queued on the shared executor at a time, and no more than
+    # the images still needed (max_images) plus DOWNLOAD_MARGIN. Downloads
+    # still running when the caller stops are abandoned.
+    if window is None:
+        window = N_DOWNLOAD_THREADS
+    executor = get_download_executor()
+    stop_event = threading.Event()
+    download_cancel_event = _any_event(cancel_event, stop_event)
+    urls = iter(urls)
+    pending = set()
+    n_images = 0
+    try:
+        while True:
+            limit = window
+            if max_images is not None:
+                limit = min(window, max_images - n_images + DOWNLOAD_MARGIN)
+            while len(pending) < limit:
+                url = next(urls, None)
+                if url is None:
+                    break
+                pending.add(executor.submit(download_image, url, download_cancel_event,
+                                            thumbnail_size, cache_images))
+            if len(pending) == 0:
+                return
+
+            # a download that hangs does not hold up a cancellation
+            done, pending = wait(pending, timeout=CANCEL_POLL_INTERVAL,
+                                 return_when=FIRST_COMPLETED)
+            for future in done:
+                if is_canceled(cancel_event):
+                    return
+                candidate = future.result()
+                if candidate is not None:
+                    n_images += 1
+                    yield candidate
+                    if max_images is not None and n_images >= max_images:
+                        return
+            if is_canceled(cancel_event):
+                return
+    finally:
+        stop_event.set()
+        for future in pending:
+            future.cancel()